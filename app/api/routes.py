@@ -1,34 +1,197 @@
-import shutil
+import os
+import asyncio
 from pathlib import Path
-from datetime import datetime
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Form
-from fastapi.responses import FileResponse
-from pydantic import BaseModel, Field
+from urllib.parse import quote
+from email.utils import formatdate, parsedate_to_datetime
+import aiofiles
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from pydantic import BaseModel, Field, ValidationError
+from streaming_form_data import StreamingFormDataParser
+from streaming_form_data.parser import ParseFailedException
+from streaming_form_data.targets import BaseTarget, ValueTarget
+from streaming_form_data.validators import MaxSizeValidator, ValidationError as FieldTooLarge
 from app.models.schemas import (
     JobResponse, JobStatus, ProcessRequest, HealthResponse,
-    ProcessUrlRequest, VideoInfoResponse
+    ProcessUrlRequest, VideoInfoResponse, MessageResponse
 )
-from app.services.processor import video_processor
 from app.services.download_service import download_service
 from app.services.minimax_service import minimax_service
 from app.services.gemini_service import gemini_service
 from app.utils.helpers import (
-    generate_job_id, get_file_extension, save_job_status, load_job_status
+    generate_job_id, get_file_extension, save_job_status, load_job_status,
+    load_job_status_raw, delete_job_status, cache_get, cache_set, utcnow,
+    shard_dir, video_info_cache_key
 )
+from app.workers import enqueue_job, _run_file_job, _run_url_job
 from app.config import get_settings
 
 router = APIRouter(prefix="/api/v1", tags=["Video Processing"])
+settings = get_settings()
+
+COPY_BUFSIZE = 1 << 20
+
+# Allowance for multipart boundaries and form fields when comparing
+# Content-Length against the file size limit
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Cap for each non-file form field; they are all short scalars
+FORM_FIELD_MAX_BYTES = 1024
+
+# Form fields accepted alongside the uploaded video in /process, and their
+# OpenAPI schema, both derived from ProcessRequest
+PROCESS_FORM_FIELDS = tuple(ProcessRequest.model_fields)
+PROCESS_FORM_SCHEMA = {
+    "type": "object",
+    "required": ["file"],
+    "properties": {
+        "file": {"type": "string", "format": "binary"},
+        **ProcessRequest.model_json_schema()["properties"],
+    },
+}
+
+
+def _is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since against the file's validators."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since.timestamp()
+
+    return False
+
+
+def _serve_output_file(
+    request: Request,
+    path: Path,
+    media_type: str,
+    stat_result: os.stat_result
+) -> Response:
+    """
+    Serve a file from the output directory.
+    Answers conditional requests with 304 using an ETag built from size and
+    mtime. With X_ACCEL_ENABLED, nginx streams the file itself via
+    X-Accel-Redirect; otherwise Starlette's FileResponse is used with the
+    stat already taken.
+    """
+    etag = f'"{stat_result.st_size:x}-{int(stat_result.st_mtime):x}"'
+    cache_headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": "public, max-age=3600",
+    }
+
+    if _is_not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=cache_headers)
+
+    if settings.x_accel_enabled:
+        relative = path.resolve().relative_to(settings.output_path.resolve())
+        filename = quote(path.name)
+        if filename == path.name:
+            disposition = f'attachment; filename="{path.name}"'
+        else:
+            disposition = f"attachment; filename*=utf-8''{filename}"
+        return Response(
+            status_code=200,
+            headers={
+                "X-Accel-Redirect": settings.x_accel_prefix + quote(relative.as_posix()),
+                "Content-Type": media_type,
+                "Content-Disposition": disposition,
+                **cache_headers,
+            }
+        )
+
+    return FileResponse(
+        path=path,
+        media_type=media_type,
+        filename=path.name,
+        stat_result=stat_result,
+        headers=cache_headers
+    )
+
+
+async def _reject_busy(jobs_path: Path, job_id: str) -> None:
+    """Drop a job that could not be queued and tell the client to retry."""
+    await delete_job_status(jobs_path, job_id)
+    raise HTTPException(
+        status_code=503,
+        detail="Server busy, too many queued jobs",
+        headers={"Retry-After": "30"}
+    )
+
+
+class _UploadTarget(BaseTarget):
+    """
+    Stream the uploaded video part straight to disk.
+    Validates the extension before the first byte is written and aborts
+    as soon as the upload exceeds the configured size limit.
+    """
+
+    def __init__(self, upload_dir: Path, job_id: str, allowed_extensions: frozenset[str], max_bytes: int):
+        super().__init__()
+        self.upload_dir = upload_dir
+        self.job_id = job_id
+        self.allowed_extensions = allowed_extensions
+        self.max_bytes = max_bytes
+        self.path: Path | None = None
+        self.bytes_written = 0
+        self._fd = None
+
+    async def on_start_async(self):
+        extension = get_file_extension(self.multipart_filename or "")
+        if extension not in self.allowed_extensions:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid file type. Allowed: {settings.allowed_extensions}"
+            )
+        upload_dir = shard_dir(self.upload_dir, self.job_id, create=True)
+        self.path = upload_dir / f"{self.job_id}.{extension}"
+        self._fd = await aiofiles.open(self.path, "wb", buffering=COPY_BUFSIZE)
+
+    async def on_data_received_async(self, chunk: bytes):
+        self.bytes_written += len(chunk)
+        if self.bytes_written > self.max_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large. Max size: {self.max_bytes // (1024 * 1024)}MB"
+            )
+        await self._fd.write(chunk)
+
+    async def on_finish_async(self):
+        await self.close()
+
+    async def close(self):
+        if self._fd:
+            await self._fd.close()
+            self._fd = None
 
+    async def discard(self):
+        """Close and remove a partially written upload."""
+        await self.close()
+        if self.path:
+            self.path.unlink(missing_ok=True)
 
-@router.get("/health", response_model=HealthResponse)
+
+# Health payload never changes within a process, serialize it once
+HEALTH_RESPONSE_JSON = HealthResponse(
+    status="healthy",
+    version="1.0.0",
+    whisper_model=settings.whisper_model_size
+).model_dump_json().encode()
+
+
+@router.get("/health", responses={200: {"model": HealthResponse}})
 async def health_check():
     """Check API health status."""
-    settings = get_settings()
-    return HealthResponse(
-        status="healthy",
-        version="1.0.0",
-        whisper_model=settings.whisper_model_size
-    )
+    return Response(content=HEALTH_RESPONSE_JSON, media_type="application/json")
 
 
 class MusicTestRequest(BaseModel):
@@ -55,7 +218,6 @@ async def test_music_generation(request: MusicTestRequest):
 
     Returns the generated music file URL.
     """
-    settings = get_settings()
 
     if not settings.minimax_api_key:
         raise HTTPException(
@@ -94,70 +256,121 @@ async def test_music_generation(request: MusicTestRequest):
 
 
 @router.get("/music/{filename}")
-async def download_music(filename: str):
+async def download_music(filename: str, request: Request):
     """Download a generated music file."""
-    settings = get_settings()
     music_path = settings.output_path / filename
 
-    if not music_path.exists():
+    try:
+        stat_result = music_path.stat()
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Music file not found")
 
-    return FileResponse(
-        path=music_path,
-        media_type="audio/mpeg",
-        filename=filename
-    )
+    return _serve_output_file(request, music_path, "audio/mpeg", stat_result)
 
 
-@router.post("/process", response_model=JobResponse)
-async def process_video(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...),
-    max_clips: int = Form(default=5),
-    min_clip_duration: float = Form(default=10.0),
-    max_clip_duration: float = Form(default=120.0),
-    include_captions: bool = Form(default=True),
-    caption_style: str = Form(default="default"),
-    caption_mode: str = Form(default="clipper"),
-    add_background_music: bool = Form(default=False)
-):
+@router.post(
+    "/process",
+    response_model=JobResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {"schema": PROCESS_FORM_SCHEMA}
+            },
+        }
+    },
+)
+async def process_video(request: Request):
     """
     Upload a video file and start processing.
     Returns a job ID for tracking progress.
 
+    The multipart body is streamed straight to disk. Oversized uploads are
+    rejected up front from Content-Length, or as soon as they cross the size
+    limit when the length is not declared.
+
     Caption styles: default, neon, fire, ocean, minimal
     Caption modes: clipper (word-by-word highlight), karaoke (smooth fill)
     Add background music: AI-generated instrumental using MiniMax
     """
-    settings = get_settings()
-
-    # Validate file extension
-    extension = get_file_extension(file.filename or "")
-    if extension not in settings.allowed_extensions_list:
+    # Reject oversized bodies before reading anything
+    try:
+        content_length = int(request.headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+    if content_length > settings.max_video_size_bytes + MULTIPART_OVERHEAD_BYTES:
         raise HTTPException(
-            status_code=400,
-            detail=f"Invalid file type. Allowed: {settings.allowed_extensions}"
+            status_code=413,
+            detail=f"File too large. Max size: {settings.max_video_size_mb}MB"
         )
 
-    # Generate job ID and save file
     job_id = generate_job_id()
-    upload_path = settings.upload_path / f"{job_id}.{extension}"
 
-    # Save uploaded file
-    with open(upload_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    try:
+        parser = StreamingFormDataParser(headers=request.headers)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
 
-    # Check file size
-    file_size = upload_path.stat().st_size
-    if file_size > settings.max_video_size_bytes:
-        upload_path.unlink()
+    upload = _UploadTarget(
+        settings.upload_path,
+        job_id,
+        settings.allowed_extensions_set,
+        settings.max_video_size_bytes
+    )
+    parser.register("file", upload)
+    fields = {
+        name: ValueTarget(validator=MaxSizeValidator(FORM_FIELD_MAX_BYTES))
+        for name in PROCESS_FORM_FIELDS
+    }
+    for name, target in fields.items():
+        parser.register(name, target)
+
+    # Stream the body, aborting early on invalid type or size. Chunked
+    # bodies have no Content-Length, so the whole body is counted too
+    max_body_bytes = settings.max_video_size_bytes + MULTIPART_OVERHEAD_BYTES
+    body_bytes = 0
+    try:
+        async for chunk in request.stream():
+            body_bytes += len(chunk)
+            if body_bytes > max_body_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File too large. Max size: {settings.max_video_size_mb}MB"
+                )
+            await parser.adata_received(chunk)
+    except FieldTooLarge:
+        await upload.discard()
         raise HTTPException(
-            status_code=400,
-            detail=f"File too large. Max size: {settings.max_video_size_mb}MB"
+            status_code=413,
+            detail=f"Form field too large. Max size: {FORM_FIELD_MAX_BYTES} bytes"
         )
+    except ParseFailedException:
+        await upload.discard()
+        raise HTTPException(status_code=400, detail="Malformed multipart body")
+    except BaseException:
+        # Rejections, client disconnects, cancellation: no job is created,
+        # so don't leave the partial file behind
+        await upload.discard()
+        raise
+    finally:
+        await upload.close()
+
+    if upload.path is None:
+        raise HTTPException(status_code=422, detail="Missing file upload")
+
+    # Create process request from the submitted form fields
+    try:
+        process_request = ProcessRequest.model_validate({
+            name: target.value.decode()
+            for name, target in fields.items()
+            if target.value
+        })
+    except ValidationError as e:
+        await upload.discard()
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
 
     # Create initial job record
-    now = datetime.utcnow()
+    now = utcnow()
     job = JobResponse(
         job_id=job_id,
         status=JobStatus.PENDING,
@@ -168,58 +381,23 @@ async def process_video(
     )
     await save_job_status(settings.jobs_path, job_id, job)
 
-    # Create process request
-    request = ProcessRequest(
-        max_clips=max_clips,
-        min_clip_duration=min_clip_duration,
-        max_clip_duration=max_clip_duration,
-        include_captions=include_captions,
-        caption_style=caption_style,
-        caption_mode=caption_mode,
-        add_background_music=add_background_music
-    )
-
-    # Start background processing
-    background_tasks.add_task(
-        process_video_file_task,
-        job_id,
-        upload_path,
-        request
-    )
+    # Queue for the worker process pool
+    try:
+        enqueue_job(
+            _run_file_job,
+            job_id,
+            str(upload.path),
+            process_request.model_dump_json()
+        )
+    except asyncio.QueueFull:
+        upload.path.unlink(missing_ok=True)
+        await _reject_busy(settings.jobs_path, job_id)
 
     return job
 
 
-def process_video_file_task(job_id: str, video_path: Path, request: ProcessRequest):
-    """Background task to process uploaded video file."""
-    import asyncio
-
-    async def _run():
-        try:
-            await video_processor.process_video(job_id, video_path, request)
-        except Exception as e:
-            settings = get_settings()
-            job = await load_job_status(settings.jobs_path, job_id)
-            if job:
-                job.status = JobStatus.FAILED
-                job.error = str(e)
-                job.message = f"Processing failed: {str(e)}"
-                job.updated_at = datetime.utcnow()
-                await save_job_status(settings.jobs_path, job_id, job)
-
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        loop.run_until_complete(_run())
-    finally:
-        loop.close()
-
-
 @router.post("/process-url", response_model=JobResponse)
-async def process_video_from_url(
-    background_tasks: BackgroundTasks,
-    request: ProcessUrlRequest
-):
+async def process_video_from_url(request: ProcessUrlRequest):
     """
     Process video from URL (YouTube, YouTube Shorts, or direct video link).
     Supports:
@@ -228,11 +406,10 @@ async def process_video_from_url(
     - Direct links: https://example.com/video.mp4
     - Other sites supported by yt-dlp (Twitter, TikTok, etc.)
     """
-    settings = get_settings()
     job_id = generate_job_id()
 
     # Create initial job record
-    now = datetime.utcnow()
+    now = utcnow()
     job = JobResponse(
         job_id=job_id,
         status=JobStatus.PENDING,
@@ -245,110 +422,66 @@ async def process_video_from_url(
 
     # Create process request
     process_request = ProcessRequest(
-        max_clips=request.max_clips,
-        min_clip_duration=request.min_clip_duration,
-        max_clip_duration=request.max_clip_duration,
-        include_captions=request.include_captions,
-        caption_style=request.caption_style,
-        caption_mode=request.caption_mode,
-        add_background_music=request.add_background_music
+        **request.model_dump(include=set(PROCESS_FORM_FIELDS))
     )
 
-    # Start background processing with download
-    background_tasks.add_task(
-        process_video_from_url_task,
-        job_id,
-        request.url,
-        process_request
-    )
+    # Queue for the worker process pool (download + processing)
+    try:
+        enqueue_job(
+            _run_url_job,
+            job_id,
+            request.url,
+            process_request.model_dump_json()
+        )
+    except asyncio.QueueFull:
+        await _reject_busy(settings.jobs_path, job_id)
 
     return job
 
 
-def process_video_from_url_task(
-    job_id: str,
-    url: str,
-    request: ProcessRequest
-):
-    """Background task to download and process video from URL."""
-    import asyncio
-
-    async def _run():
-        settings = get_settings()
-        try:
-            # Update status to downloading
-            from app.utils.helpers import update_job_progress
-            await update_job_progress(
-                settings.jobs_path, job_id, JobStatus.DOWNLOADING, 5,
-                "Downloading video..."
-            )
-
-            # Download video
-            video_path, source_type = await download_service.download(
-                url,
-                settings.upload_path,
-                job_id
-            )
-
-            await update_job_progress(
-                settings.jobs_path, job_id, JobStatus.PROCESSING, 10,
-                f"Download complete ({source_type}). Starting processing..."
-            )
-
-            # Process the downloaded video
-            await video_processor.process_video(job_id, video_path, request)
-
-        except Exception as e:
-            # Mark job as failed
-            job = await load_job_status(settings.jobs_path, job_id)
-            if job:
-                job.status = JobStatus.FAILED
-                job.error = str(e)
-                job.message = f"Processing failed: {str(e)}"
-                job.updated_at = datetime.utcnow()
-                await save_job_status(settings.jobs_path, job_id, job)
-
-    # Run the async function in event loop
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        loop.run_until_complete(_run())
-    finally:
-        loop.close()
-
-
 @router.get("/video-info", response_model=VideoInfoResponse)
 async def get_video_info(url: str):
     """
     Get video information without downloading.
     Useful for previewing video details before processing.
+    Results are cached per URL for VIDEO_INFO_CACHE_TTL seconds.
     """
+    cache_key = video_info_cache_key(url)
+
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        return VideoInfoResponse.model_validate_json(cached)
+
     try:
         info = await download_service.get_video_info(url)
-        return VideoInfoResponse(**info)
+        response = VideoInfoResponse(**info)
     except Exception as e:
         raise HTTPException(
             status_code=400,
             detail=f"Failed to get video info: {str(e)}"
         )
 
+    await cache_set(cache_key, response.model_dump_json(), settings.video_info_cache_ttl)
+    return response
 
-@router.get("/jobs/{job_id}", response_model=JobResponse)
+
+@router.get("/jobs/{job_id}", responses={200: {"model": JobResponse}})
 async def get_job_status(job_id: str):
     """Get the status of a processing job."""
-    settings = get_settings()
-    job = await load_job_status(settings.jobs_path, job_id)
+    # Stored JSON is already a serialized JobResponse, pass it through as-is
+    raw = await load_job_status_raw(settings.jobs_path, job_id)
 
-    if not job:
+    if raw is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    return job
+    return Response(content=raw, media_type="application/json")
 
 
 @router.get("/jobs/{job_id}/clips/{clip_index}")
 async def download_clip(
     job_id: str,
     clip_index: int,
+    request: Request,
     captioned: bool = True,
     with_music: bool = False
 ):
@@ -361,7 +494,6 @@ async def download_clip(
         captioned: If True, returns captioned version (default)
         with_music: If True, returns version with background music (if available)
     """
-    settings = get_settings()
     job = await load_job_status(settings.jobs_path, job_id)
 
     if not job:
@@ -386,49 +518,41 @@ async def download_clip(
     else:
         clip_path = Path(clip.clip_path)
 
-    if not clip_path.exists():
+    try:
+        stat_result = clip_path.stat()
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Clip file not found")
 
-    return FileResponse(
-        path=clip_path,
-        media_type="video/mp4",
-        filename=clip_path.name
-    )
+    return _serve_output_file(request, clip_path, "video/mp4", stat_result)
 
 
-@router.delete("/jobs/{job_id}")
+@router.delete("/jobs/{job_id}", response_model=MessageResponse)
 async def delete_job(job_id: str):
     """Delete a job and its associated files."""
-    settings = get_settings()
     job = await load_job_status(settings.jobs_path, job_id)
 
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
 
     # Delete associated files
-    # Upload file
-    for ext in settings.allowed_extensions_list + ['mp4', 'mkv', 'webm']:
-        upload_file = settings.upload_path / f"{job_id}.{ext}"
-        if upload_file.exists():
-            upload_file.unlink()
+    # Upload file (any extension); uploads stored before sharding live
+    # directly in upload_path
+    for upload_dir in (shard_dir(settings.upload_path, job_id), settings.upload_path):
+        for upload_file in upload_dir.glob(f"{job_id}.*"):
+            upload_file.unlink(missing_ok=True)
 
-    # Output clips
+    # Output clips, deduplicated since captioned_clip_path may equal clip_path
     if job.result:
+        clip_files = set()
         for clip in job.result.clips:
-            clip_path = Path(clip.clip_path)
-            captioned_path = Path(clip.captioned_clip_path)
-            if clip_path.exists():
-                clip_path.unlink()
-            if captioned_path.exists() and captioned_path != clip_path:
-                captioned_path.unlink()
+            clip_files.add(Path(clip.clip_path))
+            clip_files.add(Path(clip.captioned_clip_path))
             if clip.music_clip_path:
-                music_path = Path(clip.music_clip_path)
-                if music_path.exists():
-                    music_path.unlink()
+                clip_files.add(Path(clip.music_clip_path))
+        for clip_file in clip_files:
+            clip_file.unlink(missing_ok=True)
 
-    # Job file
-    job_file = settings.jobs_path / f"{job_id}.json"
-    if job_file.exists():
-        job_file.unlink()
+    # Job record
+    await delete_job_status(settings.jobs_path, job_id)
 
-    return {"message": "Job deleted successfully"}
+    return MessageResponse(message="Job deleted successfully")
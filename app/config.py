@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from pathlib import Path
-from functools import lru_cache
+from functools import lru_cache, cached_property
 
 
 class Settings(BaseSettings):
@@ -8,19 +8,24 @@ class Settings(BaseSettings):
     gemini_api_key: str = ""
     hf_token: str = ""
     minimax_api_key: str = ""
+    gemini_concurrency: int = 4  # Concurrent Gemini requests per job process
 
     # Music Settings
     music_volume: float = 0.3  # Background music volume (0-1)
 
     # Whisper Configuration
     whisper_model_size: str = "base"
-    whisper_device: str = "cpu"
-    whisper_compute_type: str = "int8"
+    whisper_device: str = "auto"  # auto, cpu, cuda
+    whisper_compute_type: str = "auto"  # auto, int8, int8_float16, float16, float32
+    whisper_batch_size: int = 8  # VAD chunks per encoder batch
+    whisper_cpu_threads: int = 0  # CPU inference threads; 0 = cores / worker_processes
+    whisper_preload: bool = True  # Load the model in job workers at startup
 
     # Application Settings
     debug: bool = False
     host: str = "0.0.0.0"
     port: int = 8000
+    api_workers: int = 1  # Uvicorn worker processes (ignored with debug reload)
 
     # Storage paths
     base_dir: Path = Path(__file__).resolve().parent.parent
@@ -29,10 +34,26 @@ class Settings(BaseSettings):
     output_dir: str = "storage/output"
     jobs_dir: str = "jobs"
 
+    # Serve downloads through nginx X-Accel-Redirect instead of from Python
+    x_accel_enabled: bool = False
+    x_accel_prefix: str = "/internal/clips/"
+
+    # Job store: "file" (JSON files in jobs_dir) or "redis"
+    job_store: str = "file"
+    redis_url: str = "redis://localhost:6379/0"  # unix:///path/to/redis.sock also works
+    job_ttl_seconds: int = 7 * 24 * 3600
+    video_info_cache_ttl: int = 600  # Seconds to cache /video-info lookups
+
     # Processing Settings
     max_video_size_mb: int = 500
     max_video_duration_min: int = 10  # Max 10 minutes
     allowed_extensions: str = "mp4,mov,avi,mkv,webm"
+    ytdl_workers: int = 0  # yt-dlp processes for /video-info; 0 = min(cpu_count, max_concurrent_jobs)
+    download_chunk_size: int = 1 << 20  # Bytes per read when downloading direct links
+    ffmpeg_concurrency: int = 0  # ffmpeg runs per job at once (threads split between them); 0 = min(cpu_count, 4)
+    worker_processes: int = 2  # Job processes running the pipeline in parallel
+    max_concurrent_jobs: int = 2  # Jobs allowed to run at once
+    max_queue_depth: int = 20  # Jobs allowed to wait before returning 503
 
     @property
     def max_video_duration_sec(self) -> float:
@@ -54,10 +75,14 @@ class Settings(BaseSettings):
     def jobs_path(self) -> Path:
         return self.base_dir / self.jobs_dir
 
-    @property
+    @cached_property
     def allowed_extensions_list(self) -> list[str]:
         return [ext.strip().lower() for ext in self.allowed_extensions.split(",")]
 
+    @cached_property
+    def allowed_extensions_set(self) -> frozenset[str]:
+        return frozenset(self.allowed_extensions_list)
+
     @property
     def max_video_size_bytes(self) -> int:
         return self.max_video_size_mb * 1024 * 1024
@@ -1,7 +1,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.routes import router
+from app.models.schemas import ServiceInfoResponse
 from app.config import get_settings
+from app.workers import start_dispatcher, shutdown_executor
+from app.services.download_service import download_service
 
 settings = get_settings()
 
@@ -33,15 +36,23 @@ async def startup_event():
     settings.temp_path.mkdir(parents=True, exist_ok=True)
     settings.output_path.mkdir(parents=True, exist_ok=True)
     settings.jobs_path.mkdir(parents=True, exist_ok=True)
+    start_dispatcher()
 
 
-@app.get("/")
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Wait for running jobs and stop the worker processes."""
+    await shutdown_executor()
+    download_service.close()
+
+
+@app.get("/", response_model=ServiceInfoResponse)
 async def root():
-    return {
-        "service": "Clipper Service",
-        "version": "1.0.0",
-        "docs": "/docs"
-    }
+    return ServiceInfoResponse(
+        service="Clipper Service",
+        version="1.0.0",
+        docs="/docs"
+    )
 
 
 if __name__ == "__main__":
@@ -50,5 +61,8 @@ if __name__ == "__main__":
         "app.main:app",
         host=settings.host,
         port=settings.port,
-        reload=settings.debug
+        reload=settings.debug,
+        loop="uvloop",
+        http="httptools",
+        workers=settings.api_workers
     )
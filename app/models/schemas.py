@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from enum import Enum
 from datetime import datetime
 
@@ -19,12 +19,17 @@ class JobStatus(str, Enum):
 
 
 class WordTimestamp(BaseModel):
+    # Immutable: created in bulk (one per transcribed word) and never mutated
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     word: str
     start: float
     end: float
 
 
 class TranscriptSegment(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     text: str
     start: float
     end: float
@@ -77,6 +82,8 @@ class JobResponse(BaseModel):
     message: str = ""
     created_at: datetime
     updated_at: datetime
+    detected_language: str | None = None
+    detected_language_probability: float | None = None
     result: ProcessingResult | None = None
     error: str | None = None
 
@@ -98,6 +105,10 @@ class ProcessRequest(BaseModel):
         default=False,
         description="Add AI-generated background music using MiniMax"
     )
+    allow_stream_copy: bool = Field(
+        default=True,
+        description="Copy uncaptioned clips without re-encoding when the start is on a keyframe"
+    )
 
 
 class HealthResponse(BaseModel):
@@ -106,6 +117,16 @@ class HealthResponse(BaseModel):
     whisper_model: str
 
 
+class ServiceInfoResponse(BaseModel):
+    service: str
+    version: str
+    docs: str
+
+
+class MessageResponse(BaseModel):
+    message: str
+
+
 class ProcessUrlRequest(BaseModel):
     url: str = Field(..., description="Video URL (YouTube, YouTube Shorts, or direct link)")
     max_clips: int = Field(default=5, ge=1, le=20)
@@ -124,6 +145,10 @@ class ProcessUrlRequest(BaseModel):
         default=False,
         description="Add AI-generated background music using MiniMax"
     )
+    allow_stream_copy: bool = Field(
+        default=True,
+        description="Copy uncaptioned clips without re-encoding when the start is on a keyframe"
+    )
 
 
 class VideoInfoResponse(BaseModel):
@@ -1,34 +1,118 @@
+import os
 import re
 import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from urllib.parse import urlparse
 import yt_dlp
-import aiofiles
 import httpx
 from app.config import get_settings
 
+_YT_RE = re.compile(r'(?:youtube\.com/(?:watch\?v=|shorts/|embed/|v/)|youtu\.be/)')
+_VIDEO_EXT_RE = re.compile(r'\.(?:mp4|mov|avi|mkv|webm|m4v)$', re.IGNORECASE)
+
+YDL_DOWNLOAD_OPTS = {
+    # Limit to 480p max to reduce file size and processing time
+    'format': 'bestvideo[height<=480][ext=mp4]+bestaudio[ext=m4a]/best[height<=480][ext=mp4]/best[height<=480]/best',
+    'merge_output_format': 'mp4',
+    'quiet': True,
+    'no_warnings': True,
+}
+YDL_INFO_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': False,
+}
+
+# YoutubeDL instances are expensive to build (extractor registry, format
+# parsing, cookie jar) but not thread-safe, so each thread (job worker
+# download threads, yt-dlp pool processes) keeps its own instance per option
+# set.
+_ydl_local = threading.local()
+
+
+def _get_ydl(opts: dict) -> yt_dlp.YoutubeDL:
+    """Get this thread's reusable YoutubeDL for the given options."""
+    instances = getattr(_ydl_local, 'instances', None)
+    if instances is None:
+        instances = _ydl_local.instances = {}
+    key = tuple(sorted(opts.items()))
+    ydl = instances.get(key)
+    if ydl is None:
+        ydl = instances[key] = yt_dlp.YoutubeDL(dict(opts))
+    return ydl
+
+
+def _ydl_download(url: str, output_template: str) -> tuple[str, dict]:
+    """
+    Probe and download in one pass: the info dict from the single
+    extract_info call is fed straight back into the download step.
+    Runs in a job worker thread; returns (file_path, summarized info).
+    """
+    ydl = _get_ydl(YDL_DOWNLOAD_OPTS)
+    ydl.params['outtmpl']['default'] = output_template
+    info = ydl.extract_info(url, download=False)
+    info = ydl.process_ie_result(info, download=True)
+    # Final path after merging/remuxing, as reported by yt-dlp
+    downloads = info.get('requested_downloads')
+    file_path = downloads[-1]['filepath'] if downloads else ydl.prepare_filename(info)
+    return file_path, _summarize_info(info)
+
+
+def _ydl_extract_info(url: str) -> dict:
+    """Extract video info without downloading. Runs in the yt-dlp process pool."""
+    info = _get_ydl(YDL_INFO_OPTS).extract_info(url, download=False)
+    return _summarize_info(info)
+
+
+def _summarize_info(info: dict) -> dict:
+    """Reduce a yt-dlp info dict to the fields exposed by the API."""
+    return {
+        'title': info.get('title') or 'Unknown',
+        'duration': info.get('duration') or 0,
+        'uploader': info.get('uploader') or 'Unknown',
+        'thumbnail': info.get('thumbnail'),
+        'description': info.get('description') or '',
+    }
+
 
 class DownloadService:
     def __init__(self):
         self.settings = get_settings()
+        self._ytdl_pool: ProcessPoolExecutor | None = None
+
+    def _get_ytdl_pool(self) -> ProcessPoolExecutor:
+        """
+        Lazy create the yt-dlp process pool used by the API process.
+        yt-dlp extraction is CPU-heavy pure Python, so it runs in its own
+        processes instead of competing for the GIL with request handling.
+        Downloads run inside job worker processes and don't use it.
+        """
+        if self._ytdl_pool is None:
+            max_workers = self.settings.ytdl_workers or min(
+                os.cpu_count() or 1, self.settings.max_concurrent_jobs
+            )
+            self._ytdl_pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._ytdl_pool
+
+    def close(self) -> None:
+        """Shut down the yt-dlp process pool."""
+        if self._ytdl_pool is not None:
+            self._ytdl_pool.shutdown(wait=False, cancel_futures=True)
+            self._ytdl_pool = None
 
     def _is_youtube_url(self, url: str) -> bool:
         """Check if URL is a YouTube link (including Shorts)."""
-        youtube_patterns = [
-            r'(youtube\.com/watch\?v=)',
-            r'(youtube\.com/shorts/)',
-            r'(youtu\.be/)',
-            r'(youtube\.com/embed/)',
-            r'(youtube\.com/v/)',
-        ]
-        return any(re.search(pattern, url) for pattern in youtube_patterns)
+        return _YT_RE.search(url) is not None
 
     def _is_direct_video_url(self, url: str) -> bool:
         """Check if URL is a direct video file link."""
-        video_extensions = ['.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v']
-        parsed = urlparse(url)
-        path = parsed.path.lower()
-        return any(path.endswith(ext) for ext in video_extensions)
+        return _VIDEO_EXT_RE.search(urlparse(url).path) is not None
 
     def _get_url_type(self, url: str) -> str:
         """Determine the type of URL."""
@@ -47,38 +131,29 @@ class DownloadService:
         url: str,
         output_path: Path,
         job_id: str
-    ) -> Path:
-        """Download video from YouTube or YouTube Shorts."""
+    ) -> tuple[Path, dict]:
+        """
+        Download video from YouTube or YouTube Shorts.
+        Returns tuple of (file_path, video_info).
+        """
         output_file = output_path / f"{job_id}.mp4"
+        return await self.fetch_info_and_download(url, str(output_file))
 
-        ydl_opts = {
-            # Limit to 480p max to reduce file size and processing time
-            'format': 'bestvideo[height<=480][ext=mp4]+bestaudio[ext=m4a]/best[height<=480][ext=mp4]/best[height<=480]/best',
-            'outtmpl': str(output_file),
-            'merge_output_format': 'mp4',
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-        }
-
-        def _download():
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-
-        # Run in thread pool to not block async
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, _download)
-
-        # yt-dlp might add extension, find the actual file
-        if output_file.exists():
-            return output_file
-
-        # Check for file with different naming
-        for file in output_path.glob(f"{job_id}.*"):
-            if file.suffix.lower() in ['.mp4', '.mkv', '.webm']:
-                return file
+    async def fetch_info_and_download(self, url: str, output_template: str) -> tuple[Path, dict]:
+        """
+        Extract video info and download with a single yt-dlp probe.
+        Returns tuple of (file_path, video_info); video_info has the same
+        shape as get_video_info.
 
-        raise FileNotFoundError(f"Downloaded file not found for job {job_id}")
+        Only called from job worker processes, which have nothing else to
+        do meanwhile: a thread is enough, a nested process pool would only
+        add spawn latency and idle processes.
+        """
+        file_path, info = await asyncio.to_thread(_ydl_download, url, output_template)
+        file_path = Path(file_path)
+        if not file_path.exists():
+            raise FileNotFoundError(f"Downloaded file not found: {file_path.name}")
+        return file_path, info
 
     async def download_direct_url(
         self,
@@ -94,88 +169,86 @@ class DownloadService:
         async with httpx.AsyncClient(follow_redirects=True, timeout=300.0) as client:
             async with client.stream('GET', url) as response:
                 response.raise_for_status()
-                async with aiofiles.open(output_file, 'wb') as f:
-                    async for chunk in response.aiter_bytes(chunk_size=8192):
-                        await f.write(chunk)
+                await self._stream_to_file(response, output_file)
 
         return output_file
 
+    async def _stream_to_file(self, response: httpx.Response, output_file: Path) -> None:
+        """
+        Write a streamed response to disk, overlapping network reads with
+        disk writes. A bounded queue of large chunks applies backpressure
+        (~8 MB in flight at the default chunk size).
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue[bytes | None] = asyncio.Queue(maxsize=8)
+        write_error: list[OSError] = []
+
+        async def _writer(f):
+            while (chunk := await queue.get()) is not None:
+                if write_error:
+                    continue  # Keep draining so the reader never blocks
+                try:
+                    await loop.run_in_executor(None, f.write, chunk)
+                except OSError as e:
+                    write_error.append(e)
+
+        with open(output_file, 'wb', buffering=0) as f:
+            writer = asyncio.create_task(_writer(f))
+            try:
+                async for chunk in response.aiter_bytes(chunk_size=self.settings.download_chunk_size):
+                    if write_error:
+                        break
+                    await queue.put(chunk)
+                await queue.put(None)
+                await writer
+            except BaseException:
+                writer.cancel()
+                raise
+
+        if write_error:
+            raise write_error[0]
+
     async def download_with_ytdlp(
         self,
         url: str,
         output_path: Path,
         job_id: str
-    ) -> Path:
-        """Download video using yt-dlp (supports many sites)."""
+    ) -> tuple[Path, dict]:
+        """
+        Download video using yt-dlp (supports many sites).
+        Returns tuple of (file_path, video_info).
+        """
         output_template = str(output_path / f"{job_id}.%(ext)s")
-
-        ydl_opts = {
-            # Limit to 480p max to reduce file size and processing time
-            'format': 'bestvideo[height<=480][ext=mp4]+bestaudio[ext=m4a]/best[height<=480][ext=mp4]/best[height<=480]/best',
-            'outtmpl': output_template,
-            'merge_output_format': 'mp4',
-            'quiet': True,
-            'no_warnings': True,
-        }
-
-        def _download():
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, _download)
-
-        # Find downloaded file
-        for file in output_path.glob(f"{job_id}.*"):
-            if file.suffix.lower() in ['.mp4', '.mkv', '.webm', '.mov']:
-                return file
-
-        raise FileNotFoundError(f"Downloaded file not found for job {job_id}")
+        return await self.fetch_info_and_download(url, output_template)
 
     async def download(
         self,
         url: str,
         output_path: Path,
         job_id: str
-    ) -> tuple[Path, str]:
+    ) -> tuple[Path, str, dict | None]:
         """
         Download video from URL (auto-detect source type).
-        Returns tuple of (file_path, source_type).
+        Returns tuple of (file_path, source_type, video_info).
+        video_info is None for direct links, which have no metadata.
         """
         url_type = self._get_url_type(url)
+        info = None
 
         if url_type in ['youtube', 'youtube_shorts']:
-            file_path = await self.download_from_youtube(url, output_path, job_id)
+            file_path, info = await self.download_from_youtube(url, output_path, job_id)
         elif url_type == 'direct':
             file_path = await self.download_direct_url(url, output_path, job_id)
         else:
             # Try yt-dlp for other sites (Twitter, TikTok, etc.)
-            file_path = await self.download_with_ytdlp(url, output_path, job_id)
+            file_path, info = await self.download_with_ytdlp(url, output_path, job_id)
 
-        return file_path, url_type
+        return file_path, url_type, info
 
     async def get_video_info(self, url: str) -> dict:
         """Get video information without downloading."""
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-        }
-
-        def _extract():
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                return ydl.extract_info(url, download=False)
-
         loop = asyncio.get_event_loop()
-        info = await loop.run_in_executor(None, _extract)
-
-        return {
-            'title': info.get('title', 'Unknown'),
-            'duration': info.get('duration', 0),
-            'uploader': info.get('uploader', 'Unknown'),
-            'thumbnail': info.get('thumbnail'),
-            'description': info.get('description', ''),
-        }
+        return await loop.run_in_executor(self._get_ytdl_pool(), _ydl_extract_info, url)
 
 
 download_service = DownloadService()
@@ -1,8 +1,15 @@
+import os
+import asyncio
+import logging
 import subprocess
 import json
 from pathlib import Path
+from typing import Callable
 from app.models.schemas import VideoMetadata, WordTimestamp
-from app.utils.helpers import format_timestamp, format_ass_timestamp
+from app.utils.helpers import format_timestamp, format_ass_timestamps
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
 
 
 # Clipper-style color presets
@@ -39,11 +46,109 @@ CAPTION_STYLES = {
     },
 }
 
+# H.264 encoders in order of preference, with their quality settings
+VIDEO_ENCODERS = {
+    "h264_nvenc": ["-c:v", "h264_nvenc", "-preset", "p5", "-rc", "vbr", "-cq", "20", "-b:v", "0"],
+    "h264_qsv": ["-c:v", "h264_qsv", "-preset", "medium", "-global_quality", "20"],
+    "h264_videotoolbox": ["-c:v", "h264_videotoolbox", "-b:v", "5M"],
+    "libx264": ["-c:v", "libx264", "-preset", "fast", "-crf", "20"],
+}
+
+# RAM-backed scratch space for subtitle files
+SHM_DIR = Path("/dev/shm")
+
+# Decode on the GPU and keep frames in VRAM when encoding with NVENC
+CUDA_HWACCEL = ["-hwaccel", "cuda", "-hwaccel_device", "0", "-hwaccel_output_format", "cuda"]
+
 
 class FFmpegService:
     def __init__(self):
         self.ffmpeg_path = "ffmpeg"
         self.ffprobe_path = "ffprobe"
+        self.video_encoder: str | None = None  # Detected on first encode
+        # Encodes allowed at once per job, and the threads each one gets:
+        # every job process runs up to `concurrency` encodes, so the cores
+        # are split across both instead of each ffmpeg spawning cpu_count
+        # threads
+        settings = get_settings()
+        cpu_count = os.cpu_count() or 1
+        self.concurrency = settings.ffmpeg_concurrency or min(cpu_count, 4)
+        self.threads = [
+            "-threads",
+            str(max(1, cpu_count // (self.concurrency * settings.worker_processes)))
+        ]
+
+    async def _run(self, cmd: list[str], check: bool = True) -> tuple[bytes, bytes]:
+        """Run a command without blocking the event loop. Returns (stdout, stderr)."""
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            out, err = await proc.communicate()
+        except asyncio.CancelledError:
+            # Cancelling the wait does not stop the child process
+            proc.kill()
+            await proc.wait()
+            raise
+        if check and proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, out, err)
+        return out, err
+
+    async def get_video_encoder(self) -> str:
+        """Detect the best working H.264 encoder (cached)."""
+        if self.video_encoder is None:
+            try:
+                out, _ = await self._run([self.ffmpeg_path, "-hide_banner", "-encoders"])
+            except (OSError, subprocess.CalledProcessError):
+                out = b""
+            available = {line.split()[1] for line in out.decode().splitlines() if len(line.split()) > 1}
+            encoder = "libx264"
+            for name in VIDEO_ENCODERS:
+                if name == "libx264":
+                    break
+                # Distro builds list hardware encoders without the hardware
+                # to run them, so only trust one that encodes a test frame
+                if name in available and await self._probe_encoder(name):
+                    encoder = name
+                    break
+            self.video_encoder = encoder
+        return self.video_encoder
+
+    async def _probe_encoder(self, encoder: str) -> bool:
+        """Encode one synthetic frame, independent of any input file."""
+        cmd = [
+            self.ffmpeg_path,
+            "-hide_banner",
+            "-f", "lavfi",
+            "-i", "nullsrc=s=256x256:d=1",
+            "-frames:v", "1",
+            *VIDEO_ENCODERS[encoder],
+            "-f", "null",
+            "-"
+        ]
+        try:
+            await self._run(cmd)
+        except (OSError, subprocess.CalledProcessError):
+            logger.warning("%s is compiled in but failed a test encode, skipping it", encoder)
+            return False
+        return True
+
+    async def _encode(self, build_cmd: Callable[[str], list[str]]) -> None:
+        """
+        Run an encode with the detected encoder, falling back to libx264.
+        A working hardware encoder can still fail on a given input (codec
+        NVDEC can't decode, 10-bit source) or hit a session limit, so the
+        fallback is per call and doesn't change the detected encoder.
+        """
+        encoder = await self.get_video_encoder()
+        try:
+            await self._run(build_cmd(encoder))
+        except subprocess.CalledProcessError:
+            if encoder == "libx264":
+                raise
+            await self._run(build_cmd("libx264"))
 
     async def get_video_metadata(self, video_path: Path) -> VideoMetadata:
         """Extract metadata from video file using ffprobe."""
@@ -51,13 +156,13 @@ class FFmpegService:
             self.ffprobe_path,
             "-v", "quiet",
             "-print_format", "json",
-            "-show_format",
-            "-show_streams",
+            # Only the fields VideoMetadata needs
+            "-show_entries", "format=duration,size:stream=codec_type,width,height,r_frame_rate",
             str(video_path)
         ]
 
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        data = json.loads(result.stdout)
+        out, _ = await self._run(cmd, check=False)
+        data = json.loads(out)
 
         video_stream = next(
             (s for s in data["streams"] if s["codec_type"] == "video"),
@@ -94,7 +199,7 @@ class FFmpegService:
             str(audio_output)
         ]
 
-        subprocess.run(cmd, capture_output=True, check=True)
+        await self._run(cmd)
         return audio_output
 
     async def trim_video(
@@ -103,45 +208,98 @@ class FFmpegService:
         output_path: Path,
         start_time: float,
         end_time: float,
-        clip_name: str
+        clip_name: str,
+        stream_copy: bool = False,
+        allow_stream_copy: bool = False,
+        fps: float = 30.0
     ) -> Path:
-        """Trim video to specified time range using GPU if available."""
-        output_file = output_path / f"{clip_name}.mp4"
+        """
+        Trim video to specified time range using GPU if available.
 
-        # Try NVIDIA GPU encoding first, fallback to CPU
-        cmd = [
-            self.ffmpeg_path,
-            "-hwaccel", "cuda",
-            "-hwaccel_output_format", "cuda",
-            "-i", str(video_path),
-            "-ss", format_timestamp(start_time),
-            "-to", format_timestamp(end_time),
-            "-c:v", "h264_nvenc",  # NVIDIA GPU encoder
-            "-preset", "p4",  # Fast preset for NVENC
-            "-c:a", "aac",
-            "-y",
-            str(output_file)
-        ]
+        With stream_copy the segment is remuxed without re-encoding: much
+        faster, but the cut snaps to the keyframe at or before start_time.
+        allow_stream_copy only remuxes when a keyframe lies at start_time or
+        at most one frame before it, so the cut is as accurate as a re-encode.
+        Captioned outputs need a re-encode and go through trim_and_caption.
+        """
+        output_file = output_path / f"{clip_name}.mp4"
 
-        result = subprocess.run(cmd, capture_output=True)
+        if not stream_copy and allow_stream_copy:
+            stream_copy = await self._has_keyframe_at(video_path, start_time, 1 / fps)
 
-        # Fallback to CPU if GPU encoding fails
-        if result.returncode != 0:
+        if stream_copy:
             cmd = [
                 self.ffmpeg_path,
+                "-ss", format_timestamp(start_time),
+                "-to", format_timestamp(end_time),
+                "-i", str(video_path),
+                "-c", "copy",
+                "-avoid_negative_ts", "make_zero",
+                "-y",
+                str(output_file)
+            ]
+            await self._run(cmd)
+            return output_file
+
+        def build_cmd(encoder: str) -> list[str]:
+            hwaccel = CUDA_HWACCEL if encoder == "h264_nvenc" else []
+            return [
+                self.ffmpeg_path,
+                *hwaccel,
+                *self.threads,
                 "-i", str(video_path),
                 "-ss", format_timestamp(start_time),
                 "-to", format_timestamp(end_time),
-                "-c:v", "libx264",
-                "-preset", "fast",
+                *VIDEO_ENCODERS[encoder],
+                *self.threads,
                 "-c:a", "aac",
                 "-y",
                 str(output_file)
             ]
-            subprocess.run(cmd, capture_output=True, check=True)
 
+        await self._encode(build_cmd)
         return output_file
 
+    async def _has_keyframe_at(self, video_path: Path, time: float, tolerance: float) -> bool:
+        """
+        Check whether a video keyframe lies at time or at most tolerance
+        seconds before it. Input seeking with -c copy starts at the keyframe
+        at or before the seek point, so only then is the copied cut exact.
+        """
+        # Packet timestamps are absolute; seek times are relative to the
+        # stream start (non-zero for e.g. MPEG-TS and some MP4 edits)
+        out, _ = await self._run([
+            self.ffprobe_path,
+            "-v", "quiet",
+            "-select_streams", "v:0",
+            "-show_entries", "stream=start_time",
+            "-of", "csv=p=0",
+            str(video_path)
+        ], check=False)
+        try:
+            stream_start = float(out.decode().strip() or 0)
+        except ValueError:
+            stream_start = 0.0
+        target = stream_start + time
+
+        out, _ = await self._run([
+            self.ffprobe_path,
+            "-v", "quiet",
+            "-select_streams", "v:0",
+            # Only demux packets around the cut point
+            "-read_intervals", f"{max(0.0, target - 1):.3f}%{target + 1:.3f}",
+            "-show_entries", "packet=pts_time,flags",
+            "-of", "csv=p=0",
+            str(video_path)
+        ], check=False)
+        for line in out.decode().splitlines():
+            pts_time, _, flags = line.partition(",")
+            if "K" not in flags or pts_time in ("", "N/A"):
+                continue
+            if target - tolerance <= float(pts_time) <= target:
+                return True
+        return False
+
     def _split_into_phrases(
         self,
         words: list[WordTimestamp],
@@ -209,43 +367,37 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         if not words:
             return ass_content
 
+        # Constant within the call, so format once
+        highlight_open = "{\\c%s}" % colors['highlight']
+        highlight_close = "{\\c%s}" % colors['primary']
+        dialogue_tmpl = "Dialogue: 0,%s,%s,Default,,0,0,0,,%s\n"
+        lines = [ass_content]
+
         # Split into natural phrases
         phrases = self._split_into_phrases(words, max_words=words_per_line)
 
         for phrase in phrases:
-            phrase_start = max(0, phrase[0].start - offset)
-            phrase_end = phrase[-1].end - offset
+            upper_words = [w.word.upper() for w in phrase]
 
-            # For each word, show full phrase with current word highlighted
-            for word_idx, current_word in enumerate(phrase):
-                word_start = max(0, current_word.start - offset)
-
-                # End time: use next word start or phrase end (no gaps)
-                if word_idx < len(phrase) - 1:
-                    word_end = max(0, phrase[word_idx + 1].start - offset)
-                else:
-                    word_end = phrase_end
+            # Each word shows until the next word starts (no gaps), the last
+            # one until the phrase ends; format every boundary only once
+            boundaries = [max(0, w.start - offset) for w in phrase]
+            boundaries.append(phrase[-1].end - offset)
+            times = format_ass_timestamps(boundaries)
 
+            # For each word, show full phrase with current word highlighted
+            for word_idx in range(len(phrase)):
                 # Build phrase with current word in highlight color
-                parts = []
-                for idx, w in enumerate(phrase):
-                    if idx == word_idx:
-                        # Current word - highlight color
-                        parts.append(f"{{\\c{colors['highlight']}}}{w.word.upper()}{{\\c{colors['primary']}}}")
-                    else:
-                        parts.append(w.word.upper())
-
-                text = " ".join(parts)
-
-                ass_content += (
-                    f"Dialogue: 0,"
-                    f"{format_ass_timestamp(word_start)},"
-                    f"{format_ass_timestamp(word_end)},"
-                    f"Default,,0,0,0,,"
-                    f"{text}\n"
-                )
+                parts = upper_words[:]
+                parts[word_idx] = highlight_open + parts[word_idx] + highlight_close
+
+                lines.append(dialogue_tmpl % (
+                    times[word_idx],
+                    times[word_idx + 1],
+                    " ".join(parts)
+                ))
 
-        return ass_content
+        return "".join(lines)
 
     def _generate_karaoke_ass(
         self,
@@ -280,16 +432,16 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         if not words:
             return ass_content
 
+        dialogue_tmpl = "Dialogue: 0,%s,%s,Karaoke,,0,0,0,,%s\n"
+        lines = [ass_content]
+
         # Group into lines of 3-4 words
         words_per_line = 3
-        for i in range(0, len(words), words_per_line):
-            chunk = words[i:i + words_per_line]
-            if not chunk:
-                continue
-
-            chunk_start = max(0, chunk[0].start - offset)
-            chunk_end = chunk[-1].end - offset
+        chunks = [words[i:i + words_per_line] for i in range(0, len(words), words_per_line)]
+        starts = format_ass_timestamps(max(0, chunk[0].start - offset) for chunk in chunks)
+        ends = format_ass_timestamps(chunk[-1].end - offset for chunk in chunks)
 
+        for chunk, chunk_start, chunk_end in zip(chunks, starts, ends):
             # Build karaoke text with \kf tags (smooth fill)
             karaoke_parts = []
             for w in chunk:
@@ -297,43 +449,29 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
                 duration_cs = int((w.end - w.start) * 100)
                 karaoke_parts.append(f"{{\\kf{duration_cs}}}{w.word.upper()}")
 
-            text = " ".join(karaoke_parts)
-
-            ass_content += (
-                f"Dialogue: 0,"
-                f"{format_ass_timestamp(chunk_start)},"
-                f"{format_ass_timestamp(chunk_end)},"
-                f"Karaoke,,0,0,0,,"
-                f"{text}\n"
-            )
+            lines.append(dialogue_tmpl % (
+                chunk_start,
+                chunk_end,
+                " ".join(karaoke_parts)
+            ))
 
-        return ass_content
+        return "".join(lines)
 
-    async def add_captions(
+    async def _write_ass_file(
         self,
-        video_path: Path,
-        output_path: Path,
         words: list[WordTimestamp],
         video_metadata: VideoMetadata,
+        output_path: Path,
         clip_name: str,
-        offset: float = 0.0,
-        style: str = "default",
-        caption_mode: str = "clipper"  # "clipper" or "karaoke"
+        offset: float,
+        style: str,
+        caption_mode: str
     ) -> Path:
         """
-        Burn clipper-style captions into video with word-level timing.
-
-        Args:
-            video_path: Input video file
-            output_path: Directory for output
-            words: List of words with timestamps
-            video_metadata: Video metadata
-            clip_name: Name for output files
-            offset: Time offset for word timestamps
-            style: Caption style preset ("default", "neon", "fire", "ocean", "minimal")
-            caption_mode: "clipper" for word-by-word highlight, "karaoke" for smooth fill
+        Generate the ASS subtitle file for a clip based on caption mode.
+        Written to tmpfs when available: it is only read back by ffmpeg, so
+        callers delete it once the encode is done.
         """
-        # Generate ASS subtitle file based on mode
         if caption_mode == "karaoke":
             ass_content = self._generate_karaoke_ass(
                 words,
@@ -351,45 +489,82 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
                 style
             )
 
-        ass_file = output_path / f"{clip_name}_subs.ass"
-        with open(ass_file, "w", encoding="utf-8") as f:
-            f.write(ass_content)
+        ass_dir = SHM_DIR if SHM_DIR.is_dir() else output_path
+        ass_file = ass_dir / f"{clip_name}_subs.ass"
+        await asyncio.to_thread(ass_file.write_text, ass_content, encoding="utf-8")
+        return ass_file
 
-        output_file = output_path / f"{clip_name}_captioned.mp4"
+    async def trim_and_caption(
+        self,
+        video_path: Path,
+        output_path: Path,
+        start_time: float,
+        end_time: float,
+        words: list[WordTimestamp],
+        video_metadata: VideoMetadata,
+        clip_name: str,
+        offset: float = 0.0,
+        style: str = "default",
+        caption_mode: str = "clipper"
+    ) -> tuple[Path, Path]:
+        """
+        Trim a clip and burn captions in a single ffmpeg run.
 
-        # Try GPU encoding (subtitle filter needs CPU but encoding can use GPU)
-        cmd = [
-            self.ffmpeg_path,
-            "-i", str(video_path),
-            "-vf", f"ass='{str(ass_file)}'",
-            "-c:v", "h264_nvenc",  # NVIDIA GPU encoder
-            "-preset", "p4",
-            "-b:v", "5M",
-            "-c:a", "aac",
-            "-b:a", "192k",
-            "-y",
-            str(output_file)
-        ]
+        The segment is decoded once and split into the plain clip and the
+        captioned clip, so there is no intermediate file to write and decode
+        again. Pass offset=start_time: word timestamps are relative to the
+        original video, the trimmed segment starts at 0.
 
-        result = subprocess.run(cmd, capture_output=True)
+        Returns tuple of (clip_path, captioned_clip_path).
+        """
+        ass_file = await self._write_ass_file(
+            words, video_metadata, output_path, clip_name, offset, style, caption_mode
+        )
 
-        # Fallback to CPU if GPU fails
-        if result.returncode != 0:
-            cmd = [
+        clip_file = output_path / f"{clip_name}.mp4"
+        captioned_file = output_path / f"{clip_name}_captioned.mp4"
+
+        def build_cmd(encoder: str) -> list[str]:
+            hwaccel = []
+            graph = f"[0:v]split=2[plain][subs];[subs]ass='{str(ass_file)}'[captioned]"
+            if encoder == "h264_nvenc":
+                # GPU decode; frames leave VRAM only for the CPU-only ass filter
+                hwaccel = CUDA_HWACCEL
+                graph = (
+                    f"[0:v]hwdownload,format=nv12,split=2[plain_sw][subs];"
+                    f"[plain_sw]hwupload_cuda[plain];"
+                    f"[subs]ass='{str(ass_file)}',hwupload_cuda[captioned]"
+                )
+            return [
                 self.ffmpeg_path,
+                *hwaccel,
+                # Input seeking: decode starts at the nearest keyframe, not at 0
+                "-ss", format_timestamp(start_time),
+                "-to", format_timestamp(end_time),
+                *self.threads,
                 "-i", str(video_path),
-                "-vf", f"ass='{str(ass_file)}'",
-                "-c:v", "libx264",
-                "-preset", "fast",
-                "-crf", "20",
+                "-filter_complex", graph,
+                "-map", "[plain]", "-map", "0:a:0?",
+                *VIDEO_ENCODERS[encoder],
+                *self.threads,
+                "-c:a", "aac",
+                "-y",
+                str(clip_file),
+                "-map", "[captioned]", "-map", "0:a:0?",
+                *VIDEO_ENCODERS[encoder],
+                *self.threads,
                 "-c:a", "aac",
                 "-b:a", "192k",
                 "-y",
-                str(output_file)
+                str(captioned_file)
             ]
-            subprocess.run(cmd, capture_output=True, check=True)
 
-        return output_file
+        try:
+            await self._encode(build_cmd)
+        finally:
+            ass_file.unlink(missing_ok=True)
+
+        return clip_file, captioned_file
 
     async def mix_audio(
         self,
@@ -414,30 +589,10 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         """
         output_file = output_path / f"{clip_name}_with_music.mp4"
 
-        # Try GPU encoding first
-        cmd = [
-            self.ffmpeg_path,
-            "-i", str(video_path),
-            "-i", str(music_path),
-            "-filter_complex",
-            f"[1:a]volume={music_volume},apad[music];"
-            f"[0:a][music]amix=inputs=2:duration=first:dropout_transition=2[a]",
-            "-map", "0:v",
-            "-map", "[a]",
-            "-c:v", "h264_nvenc",
-            "-preset", "p4",
-            "-c:a", "aac",
-            "-b:a", "192k",
-            "-y",
-            str(output_file)
-        ]
-
-        result = subprocess.run(cmd, capture_output=True)
-
-        # Fallback to CPU if GPU fails
-        if result.returncode != 0:
-            cmd = [
+        def build_cmd(encoder: str) -> list[str]:
+            return [
                 self.ffmpeg_path,
+                *self.threads,
                 "-i", str(video_path),
                 "-i", str(music_path),
                 "-filter_complex",
@@ -445,15 +600,15 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
                 f"[0:a][music]amix=inputs=2:duration=first:dropout_transition=2[a]",
                 "-map", "0:v",
                 "-map", "[a]",
-                "-c:v", "libx264",
-                "-preset", "fast",
-                "-crf", "20",
+                *VIDEO_ENCODERS[encoder],
+                *self.threads,
                 "-c:a", "aac",
                 "-b:a", "192k",
                 "-y",
                 str(output_file)
             ]
-            subprocess.run(cmd, capture_output=True, check=True)
+
+        await self._encode(build_cmd)
 
         return output_file
 
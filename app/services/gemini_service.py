@@ -1,21 +1,79 @@
-import json
-import re
+import asyncio
+import threading
+import weakref
 from google import genai
 from google.genai import types
 from app.models.schemas import TranscriptSegment, KeyPoint
 from app.config import get_settings
 
 
+# Per-request timeout for Gemini calls
+GEMINI_TIMEOUT_MS = 60_000
+
+
 class GeminiService:
-    def __init__(self):
-        self._client: genai.Client | None = None
+    # Clients are shared by all instances and kept for the process lifetime
+    # so their connection pools (and TLS sessions) are reused across calls.
+    # There is one per event loop: the async transport is bound to the loop
+    # it was created on, and job workers run each job in a fresh loop.
+    _clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, genai.Client]" = (
+        weakref.WeakKeyDictionary()
+    )
+    _client_lock = threading.Lock()
+    _semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+        weakref.WeakKeyDictionary()
+    )
 
     def _get_client(self) -> genai.Client:
-        """Lazy load the Gemini client."""
-        if self._client is None:
-            settings = get_settings()
-            self._client = genai.Client(api_key=settings.gemini_api_key)
-        return self._client
+        """Lazy load the shared Gemini client for the running event loop."""
+        loop = asyncio.get_running_loop()
+        client = GeminiService._clients.get(loop)
+        if client is None:
+            with GeminiService._client_lock:
+                client = GeminiService._clients.get(loop)
+                if client is None:
+                    settings = get_settings()
+                    client = genai.Client(
+                        api_key=settings.gemini_api_key,
+                        http_options=types.HttpOptions(timeout=GEMINI_TIMEOUT_MS)
+                    )
+                    GeminiService._clients[loop] = client
+        return client
+
+    async def aclose(self) -> None:
+        """
+        Close the running loop's client; called when a job's loop ends.
+        Open keep-alive connections reference the loop, so the weak key
+        alone never lets the client be collected.
+        """
+        loop = asyncio.get_running_loop()
+        with GeminiService._client_lock:
+            client = GeminiService._clients.pop(loop, None)
+        GeminiService._semaphores.pop(loop, None)
+        if client is not None:
+            await client.aio.aclose()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Limit concurrent Gemini requests (per event loop) to respect rate limits."""
+        loop = asyncio.get_running_loop()
+        semaphore = GeminiService._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(get_settings().gemini_concurrency)
+            GeminiService._semaphores[loop] = semaphore
+        return semaphore
+
+    async def _generate_content(
+        self,
+        prompt: str,
+        config: types.GenerateContentConfig
+    ) -> types.GenerateContentResponse:
+        client = self._get_client()
+        async with self._get_semaphore():
+            return await client.aio.models.generate_content(
+                model="gemini-2.0-flash",
+                contents=prompt,
+                config=config
+            )
 
     def _format_transcript_with_timestamps(
         self,
@@ -38,7 +96,6 @@ class GeminiService:
         """
         Analyze transcript and extract key points with timestamp ranges.
         """
-        client = self._get_client()
         transcript = self._format_transcript_with_timestamps(segments)
 
         prompt = f"""Analyze the following video transcript and identify the {max_clips} most important key points or moments.
@@ -72,31 +129,20 @@ TRANSCRIPT:
 
 Return ONLY the JSON array, no other text."""
 
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt,
-            config=types.GenerateContentConfig(
+        response = await self._generate_content(
+            prompt,
+            types.GenerateContentConfig(
                 temperature=0.7,
                 max_output_tokens=4096,
+                # Structured output: the SDK validates straight into KeyPoints
+                response_mime_type="application/json",
+                response_schema=list[KeyPoint],
             )
         )
-        response_text = response.text.strip()
-
-        # Clean up response - remove markdown code blocks if present
-        if response_text.startswith("```"):
-            lines = response_text.split("\n")
-            response_text = "\n".join(lines[1:-1])
-
-        try:
-            key_points_data = json.loads(response_text)
-            return [KeyPoint(**kp) for kp in key_points_data]
-        except json.JSONDecodeError:
-            # Fallback: try to extract JSON from response
-            json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
-            if json_match:
-                key_points_data = json.loads(json_match.group())
-                return [KeyPoint(**kp) for kp in key_points_data]
+
+        if response.parsed is None:
             raise ValueError("Failed to parse Gemini response as JSON")
+        return response.parsed
 
     async def generate_music_prompt(
         self,
@@ -115,8 +161,6 @@ Return ONLY the JSON array, no other text."""
         Returns:
             Music style description prompt for MiniMax
         """
-        client = self._get_client()
-
         prompt = f"""Generate a music style description for background instrumental music.
 
 Clip Title: "{title}"
@@ -134,10 +178,9 @@ The music should be instrumental only (no vocals) and suitable as background mus
 
 Return ONLY the music description paragraph, no other text."""
 
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt,
-            config=types.GenerateContentConfig(
+        response = await self._generate_content(
+            prompt,
+            types.GenerateContentConfig(
                 temperature=0.8,
                 max_output_tokens=500,
             )
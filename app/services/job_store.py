@@ -0,0 +1,152 @@
+import asyncio
+import json
+import weakref
+from datetime import datetime, timezone
+import redis.asyncio as redis
+from pydantic_core import to_json
+from app.models.schemas import JobResponse, JobStatus
+from app.config import get_settings
+
+# Progress fields stored next to the job blob (and left out of it) so that
+# progress updates can be written without re-serializing the whole job.
+PROGRESS_FIELDS = ("status", "progress", "message", "updated_at")
+_PROGRESS_FIELDS_SET = set(PROGRESS_FIELDS)
+
+# One client per event loop: redis.asyncio connections are bound to the loop
+# they were created on, and job workers run each job in a fresh loop.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, redis.Redis]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_redis() -> redis.Redis:
+    """Get the Redis client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        settings = get_settings()
+        client = redis.Redis.from_url(settings.redis_url)
+        _clients[loop] = client
+    return client
+
+
+async def close_redis() -> None:
+    """
+    Close the running loop's client. Job workers call this when a job's
+    loop ends: the pooled connections reference the loop, so the weak key
+    would otherwise never be collected.
+    """
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _job_key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+def _json_datetime(value: datetime) -> str:
+    """Datetime as pydantic serializes it inside the job JSON."""
+    return to_json(value)[1:-1].decode()
+
+
+async def save_job(job_id: str, job: JobResponse) -> None:
+    settings = get_settings()
+    client = get_redis()
+    key = _job_key(job_id)
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.hset(key, mapping={
+            "data": job.model_dump_json(exclude=_PROGRESS_FIELDS_SET),
+            "status": job.status.value,
+            "progress": job.progress,
+            "message": job.message,
+            "updated_at": _json_datetime(job.updated_at),
+        })
+        pipe.expire(key, settings.job_ttl_seconds)
+        await pipe.execute()
+
+
+async def _load_job_data(job_id: str) -> dict | None:
+    raw = await get_redis().hgetall(_job_key(job_id))
+    if not raw:
+        return None
+    data = json.loads(raw[b"data"])
+    # Progress fields may be newer than the blob
+    for field in PROGRESS_FIELDS:
+        value = raw.get(field.encode())
+        if value is not None:
+            data[field] = value.decode()
+    if "progress" in data:
+        data["progress"] = int(data["progress"])
+    return data
+
+
+async def load_job(job_id: str) -> JobResponse | None:
+    data = await _load_job_data(job_id)
+    if data is None:
+        return None
+    return JobResponse(**data)
+
+
+async def load_job_raw(job_id: str) -> bytes | None:
+    """
+    Merged job JSON without parsing the stored blob: the progress fields
+    are appended to its bytes, so large results are served as stored.
+    """
+    raw = await get_redis().hgetall(_job_key(job_id))
+    if not raw:
+        return None
+    progress = {
+        field: raw[field.encode()].decode()
+        for field in PROGRESS_FIELDS
+        if field.encode() in raw
+    }
+    if "progress" in progress:
+        progress["progress"] = int(progress["progress"])
+    if not progress:
+        return raw[b"data"]
+    # Appended last: blobs saved before the progress fields were split out
+    # still carry their own copies, and JSON parsers keep the last key
+    return raw[b"data"][:-1] + b"," + to_json(progress)[1:]
+
+
+async def update_job_progress(
+    job_id: str,
+    status: JobStatus,
+    progress: int,
+    message: str = "",
+    updated_at: datetime | None = None
+) -> None:
+    key = _job_key(job_id)
+    fields = {
+        "status": status.value,
+        "progress": progress,
+        "message": message,
+        "updated_at": _json_datetime(updated_at or datetime.now(timezone.utc)),
+    }
+
+    async def _update(pipe) -> None:
+        # WATCHed: a DELETE between the check and the write aborts and
+        # retries, instead of recreating a hash without data or TTL
+        if not await pipe.exists(key):
+            return
+        pipe.multi()
+        pipe.hset(key, mapping=fields)
+
+    await get_redis().transaction(_update, key)
+
+
+async def job_exists(job_id: str) -> bool:
+    return bool(await get_redis().exists(_job_key(job_id)))
+
+
+async def delete_job(job_id: str) -> None:
+    await get_redis().delete(_job_key(job_id))
+
+
+async def cache_get(key: str) -> bytes | None:
+    return await get_redis().get(key)
+
+
+async def cache_set(key: str, value: str, ttl: int) -> None:
+    await get_redis().set(key, value, ex=ttl)
@@ -1,12 +1,37 @@
-import requests
+import asyncio
+import weakref
+import httpx
 from pathlib import Path
 from app.config import get_settings
 
+# Hex characters decoded per write (even, so slices never split a byte)
+HEX_CHUNK_CHARS = 64 * 1024
+
 
 class MinimaxService:
     def __init__(self):
         self.api_url = "https://api.minimax.io/v1/music_generation"
         self._api_key = None
+        # One client per event loop (job workers run each job in a fresh
+        # loop); reused across calls to keep the TLS connection alive
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            # 5 minute timeout for music generation
+            client = httpx.AsyncClient(timeout=300.0)
+            self._clients[loop] = client
+        return client
+
+    async def aclose(self) -> None:
+        """Close the running loop's client; called when a job's loop ends."""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
 
     def _get_api_key(self) -> str:
         if self._api_key is None:
@@ -52,17 +77,15 @@ class MinimaxService:
             }
         }
 
+        response = await self._get_client().post(
+            self.api_url,
+            headers=headers,
+            json=payload
+        )
         try:
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                timeout=300  # 5 minute timeout for music generation
-            )
             response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            error_detail = response.text if response else str(e)
-            raise ValueError(f"MiniMax API error: {response.status_code} - {error_detail}")
+        except httpx.HTTPStatusError:
+            raise ValueError(f"MiniMax API error: {response.status_code} - {response.text}")
 
         try:
             data = response.json()
@@ -80,8 +103,11 @@ class MinimaxService:
         audio_hex = data["data"]["audio"]
 
         music_file = output_path / f"{clip_name}_music.mp3"
-        with open(music_file, "wb") as f:
-            f.write(bytes.fromhex(audio_hex))
+        with open(music_file, "wb", buffering=HEX_CHUNK_CHARS) as f:
+            # Decode slice by slice so the full binary copy never coexists
+            # with the (twice as large) hex string
+            for i in range(0, len(audio_hex), HEX_CHUNK_CHARS):
+                f.write(bytes.fromhex(audio_hex[i:i + HEX_CHUNK_CHARS]))
 
         return music_file
 
@@ -1,15 +1,16 @@
+import asyncio
 from pathlib import Path
-from datetime import datetime
 from app.models.schemas import (
     JobStatus, JobResponse, ProcessRequest, ProcessingResult,
-    ClipResult, TranscriptSegment
+    ClipResult, TranscriptSegment, KeyPoint
 )
 from app.services.ffmpeg_service import ffmpeg_service
 from app.services.transcription import transcription_service
 from app.services.gemini_service import gemini_service
 from app.services.minimax_service import minimax_service
 from app.utils.helpers import (
-    save_job_status, update_job_progress, sanitize_filename
+    save_job_status, load_job_status, update_job_progress, sanitize_filename,
+    utcnow, job_exists
 )
 from app.config import get_settings
 
@@ -27,9 +28,18 @@ class VideoProcessor:
         """
         Main processing pipeline that orchestrates all services.
         """
-        jobs_path = self.settings.jobs_path
-        temp_path = self.settings.temp_path
-        output_path = self.settings.output_path
+        # Settings read once into locals; the clip tasks below use them
+        # repeatedly
+        settings = self.settings
+        jobs_path = settings.jobs_path
+        temp_path = settings.temp_path
+        output_path = settings.output_path
+        max_duration_sec = settings.max_video_duration_sec
+        music_volume = settings.music_volume
+
+        # One instance for the whole run: progress goes through the job
+        # writer, the terminal state is set on this object and saved as is
+        job = await self._get_job(jobs_path, job_id)
 
         try:
             # Step 1: Extract video metadata
@@ -40,8 +50,8 @@ class VideoProcessor:
             video_metadata = await ffmpeg_service.get_video_metadata(video_path)
 
             # Check video duration limit
-            if video_metadata.duration > self.settings.max_video_duration_sec:
-                max_min = self.settings.max_video_duration_min
+            if video_metadata.duration > max_duration_sec:
+                max_min = settings.max_video_duration_min
                 actual_min = video_metadata.duration / 60
                 raise ValueError(
                     f"Video too long: {actual_min:.1f} min. Maximum allowed: {max_min} min"
@@ -59,13 +69,30 @@ class VideoProcessor:
                 jobs_path, job_id, JobStatus.TRANSCRIBING, 30,
                 "Transcribing audio (this may take a while)..."
             )
-            transcript, transcription_info = await transcription_service.transcribe(audio_path)
+            transcription_info, segments = await transcription_service.transcribe_stream(audio_path)
+            transcript: list[TranscriptSegment] = []
+            audio_duration = transcription_info.duration or 1
+            async for segment in segments:
+                transcript.append(segment)
+                # Coalesced by the job writer, so one ping per segment is cheap
+                await update_job_progress(
+                    jobs_path, job_id, JobStatus.TRANSCRIBING,
+                    30 + int(min(segment.end / audio_duration, 1) * 20),
+                    f"Transcribing audio ({segment.end:.0f}s / {audio_duration:.0f}s)..."
+                )
+            word_index = transcription_service.build_word_index(transcript)
+
+            # Record the detected language once, as fields rather than prose
+            # repeated in every status message
+            job.status = JobStatus.ANALYZING
+            job.progress = 50
+            job.message = "Analyzing transcript..."
+            job.detected_language = transcription_info.language
+            job.detected_language_probability = transcription_info.language_probability
+            job.updated_at = utcnow()
+            if await job_exists(jobs_path, job_id):
+                await save_job_status(jobs_path, job_id, job)
 
-            # Update with detected language
-            await update_job_progress(
-                jobs_path, job_id, JobStatus.ANALYZING, 50,
-                f"Detected language: {transcription_info.language} ({transcription_info.language_probability:.1%}). Analyzing transcript..."
-            )
             key_points = await gemini_service.extract_key_points(
                 transcript,
                 max_clips=request.max_clips,
@@ -73,48 +100,57 @@ class VideoProcessor:
                 max_duration=request.max_clip_duration
             )
 
-            # Step 5: Create clips
-            clips: list[ClipResult] = []
+            # Music prompts don't depend on the clips, request them all at once
+            music_prompts: list[str] = []
+            if request.add_background_music and key_points:
+                await update_job_progress(
+                    jobs_path, job_id, JobStatus.ANALYZING, 55,
+                    f"Generating music prompts for {len(key_points)} clips..."
+                )
+                music_prompts = await asyncio.gather(*(
+                    gemini_service.generate_music_prompt(
+                        title=key_point.title,
+                        summary=key_point.summary,
+                        importance=key_point.importance
+                    )
+                    for key_point in key_points
+                ))
+
+            # Step 5: Create clips (concurrently, ffmpeg runs bounded)
             total_clips = len(key_points)
+            # Same bound the ffmpeg thread budget is split by
+            ffmpeg_slots = asyncio.Semaphore(ffmpeg_service.concurrency)
+            clips_done = 0
 
-            for i, key_point in enumerate(key_points):
-                progress = 60 + int((i / total_clips) * 30)
+            async def create_clip(i: int, key_point: KeyPoint) -> ClipResult:
+                nonlocal clips_done
 
-                # Trim video
-                await update_job_progress(
-                    jobs_path, job_id, JobStatus.TRIMMING, progress,
-                    f"Creating clip {i + 1}/{total_clips}..."
-                )
+                def progress() -> int:
+                    return 60 + int((clips_done / total_clips) * 30)
 
                 clip_name = sanitize_filename(f"{job_id}_clip_{i + 1}_{key_point.title[:20]}")
-                clip_path = await ffmpeg_service.trim_video(
-                    video_path,
-                    output_path,
-                    key_point.start_time,
-                    key_point.end_time,
-                    clip_name
-                )
-
-                captioned_clip_path = clip_path  # Default to same path
 
-                # Add captions if requested
+                # Get words for this time range if captions are requested
+                words = []
                 if request.include_captions:
-                    await update_job_progress(
-                        jobs_path, job_id, JobStatus.ADDING_CAPTIONS, progress + 5,
-                        f"Adding captions to clip {i + 1}/{total_clips}..."
-                    )
-
-                    # Get words for this time range
-                    words = transcription_service.get_words_in_range(
-                        transcript,
+                    words = transcription_service.get_words_in_range_indexed(
+                        word_index,
                         key_point.start_time,
                         key_point.end_time
                     )
 
-                    if words:
-                        captioned_clip_path = await ffmpeg_service.add_captions(
-                            clip_path,
+                if words:
+                    # Trim and burn captions in one ffmpeg pass
+                    await update_job_progress(
+                        jobs_path, job_id, JobStatus.ADDING_CAPTIONS, progress(),
+                        f"Creating captioned clip {i + 1}/{total_clips}..."
+                    )
+                    async with ffmpeg_slots:
+                        clip_path, captioned_clip_path = await ffmpeg_service.trim_and_caption(
+                            video_path,
                             output_path,
+                            key_point.start_time,
+                            key_point.end_time,
                             words,
                             video_metadata,
                             clip_name,
@@ -122,52 +158,78 @@ class VideoProcessor:
                             style=request.caption_style,
                             caption_mode=request.caption_mode
                         )
+                else:
+                    # Trim video
+                    await update_job_progress(
+                        jobs_path, job_id, JobStatus.TRIMMING, progress(),
+                        f"Creating clip {i + 1}/{total_clips}..."
+                    )
+                    async with ffmpeg_slots:
+                        clip_path = await ffmpeg_service.trim_video(
+                            video_path,
+                            output_path,
+                            key_point.start_time,
+                            key_point.end_time,
+                            clip_name,
+                            allow_stream_copy=request.allow_stream_copy,
+                            fps=video_metadata.fps
+                        )
+                    captioned_clip_path = clip_path  # Default to same path
 
                 music_clip_path = None
 
                 # Add background music if requested
                 if request.add_background_music:
                     await update_job_progress(
-                        jobs_path, job_id, JobStatus.GENERATING_MUSIC, progress + 8,
+                        jobs_path, job_id, JobStatus.GENERATING_MUSIC, progress(),
                         f"Generating music for clip {i + 1}/{total_clips}..."
                     )
 
-                    # Generate music prompt based on clip content
-                    music_prompt = await gemini_service.generate_music_prompt(
-                        title=key_point.title,
-                        summary=key_point.summary,
-                        importance=key_point.importance
-                    )
-
                     # Generate instrumental music
                     music_path = await minimax_service.generate_instrumental(
-                        prompt=music_prompt,
+                        prompt=music_prompts[i],
                         output_path=output_path,
                         clip_name=clip_name
                     )
 
                     # Mix music with video
                     await update_job_progress(
-                        jobs_path, job_id, JobStatus.MIXING_AUDIO, progress + 12,
+                        jobs_path, job_id, JobStatus.MIXING_AUDIO, progress(),
                         f"Mixing audio for clip {i + 1}/{total_clips}..."
                     )
 
                     # Use captioned clip if available, otherwise original clip
                     video_to_mix = captioned_clip_path if request.include_captions else clip_path
-                    music_clip_path = await ffmpeg_service.mix_audio(
-                        video_path=video_to_mix,
-                        music_path=music_path,
-                        output_path=output_path,
-                        clip_name=clip_name,
-                        music_volume=self.settings.music_volume
-                    )
+                    async with ffmpeg_slots:
+                        music_clip_path = await ffmpeg_service.mix_audio(
+                            video_path=video_to_mix,
+                            music_path=music_path,
+                            output_path=output_path,
+                            clip_name=clip_name,
+                            music_volume=music_volume
+                        )
 
-                clips.append(ClipResult(
+                # Single event loop thread, so the counter needs no lock
+                clips_done += 1
+
+                return ClipResult(
                     key_point=key_point,
                     clip_path=str(clip_path),
                     captioned_clip_path=str(captioned_clip_path),
                     music_clip_path=str(music_clip_path) if music_clip_path else None
-                ))
+                )
+
+            clip_tasks = [
+                asyncio.create_task(create_clip(i, key_point))
+                for i, key_point in enumerate(key_points)
+            ]
+            try:
+                clips: list[ClipResult] = await asyncio.gather(*clip_tasks)
+            except BaseException:
+                # Don't leave sibling clips encoding after a failure
+                for task in clip_tasks:
+                    task.cancel()
+                raise
 
             # Step 6: Create result
             result = ProcessingResult(
@@ -179,14 +241,15 @@ class VideoProcessor:
                 clips=clips
             )
 
-            # Update job as completed
-            job = await self._get_job(jobs_path, job_id)
-            job.status = JobStatus.COMPLETED
-            job.progress = 100
-            job.message = "Processing complete!"
-            job.result = result
-            job.updated_at = datetime.utcnow()
-            await save_job_status(jobs_path, job_id, job)
+            # Update job as completed, unless it was deleted meanwhile: the
+            # job was loaded once up front, saving would recreate it
+            if await job_exists(jobs_path, job_id):
+                job.status = JobStatus.COMPLETED
+                job.progress = 100
+                job.message = "Processing complete!"
+                job.result = result
+                job.updated_at = utcnow()
+                await save_job_status(jobs_path, job_id, job)
 
             # Cleanup temp files
             if audio_path.exists():
@@ -194,11 +257,10 @@ class VideoProcessor:
 
         except Exception as e:
             # Update job as failed
-            await self._mark_job_failed(jobs_path, job_id, str(e))
+            await self._mark_job_failed(jobs_path, job_id, job, str(e))
             raise
 
     async def _get_job(self, jobs_path: Path, job_id: str) -> JobResponse:
-        from app.utils.helpers import load_job_status
         job = await load_job_status(jobs_path, job_id)
         if not job:
             raise ValueError(f"Job {job_id} not found")
@@ -208,13 +270,15 @@ class VideoProcessor:
         self,
         jobs_path: Path,
         job_id: str,
+        job: JobResponse,
         error: str
     ) -> None:
-        job = await self._get_job(jobs_path, job_id)
+        if not await job_exists(jobs_path, job_id):
+            return
         job.status = JobStatus.FAILED
         job.error = error
         job.message = "Processing failed"
-        job.updated_at = datetime.utcnow()
+        job.updated_at = utcnow()
         await save_job_status(jobs_path, job_id, job)
 
 
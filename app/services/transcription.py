@@ -1,13 +1,37 @@
 import os
+import asyncio
+import functools
+import logging
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from faster_whisper import WhisperModel
+from typing import AsyncIterator, Iterator
+import ctranslate2
+import numpy as np
+from faster_whisper import WhisperModel, BatchedInferencePipeline, decode_audio
+from faster_whisper.transcribe import Segment
 from app.models.schemas import TranscriptSegment, WordTimestamp, TranscriptionInfo
+from app.utils.word_index import WordIndex, build_word_index, words_in_range
 from app.config import get_settings
 
+logger = logging.getLogger(__name__)
+
+# Whisper's input format; extract_audio writes WAV in exactly this shape
+SAMPLE_RATE = 16000
+
+# Marks the end of the segment stream in _iter_segments
+_END_OF_SEGMENTS = object()
+
 
 class TranscriptionService:
     def __init__(self):
         self._model: WhisperModel | None = None
+        self._pipeline: BatchedInferencePipeline | None = None
+        # All model work (load, transcribe, segment decoding) runs on this
+        # one thread: it keeps the event loop free and the CUDA context on
+        # a single thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="whisper")
 
     def _get_model(self) -> WhisperModel:
         """Lazy load the Whisper model."""
@@ -18,30 +42,84 @@ class TranscriptionService:
             if settings.hf_token:
                 os.environ["HF_TOKEN"] = settings.hf_token
 
-            # Device and compute type from config
+            device, compute_type = self._resolve_device(
+                settings.whisper_device, settings.whisper_compute_type
+            )
+            logger.info("Loading Whisper %s on %s (%s)", settings.whisper_model_size, device, compute_type)
+
+            cpu_threads = settings.whisper_cpu_threads or max(
+                1, (os.cpu_count() or 1) // settings.worker_processes
+            )
             self._model = WhisperModel(
                 settings.whisper_model_size,
-                device=settings.whisper_device,
-                compute_type=settings.whisper_compute_type
+                device=device,
+                compute_type=compute_type,
+                num_workers=1,
+                cpu_threads=cpu_threads
             )
+            # Batches VAD-cut chunks through the encoder together
+            self._pipeline = BatchedInferencePipeline(model=self._model)
         return self._model
 
-    async def transcribe(
+    def _resolve_device(self, device: str, compute_type: str) -> tuple[str, str]:
+        """
+        Resolve "auto" device/compute type: CUDA with INT8 weights and FP16
+        activations when a GPU is visible, INT8 on CPU otherwise.
+        Half-precision types are forced to INT8 on CPU, where CTranslate2
+        would otherwise fall back to FP32.
+        """
+        if device == "auto":
+            device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+        if compute_type == "auto":
+            compute_type = "int8_float16" if device == "cuda" else "int8"
+        elif device == "cpu" and "16" in compute_type:
+            logger.warning("compute_type %s is not supported on CPU, using int8", compute_type)
+            compute_type = "int8"
+        return device, compute_type
+
+    def warmup(self) -> None:
+        """
+        Load the model and run one second of silence through it, so model
+        loading and CUDA/cuDNN initialization happen before the first job.
+        """
+        self._executor.submit(self._warmup).result()
+
+    def _warmup(self) -> None:
+        model = self._get_model()
+        segments, _ = model.transcribe(
+            np.zeros(SAMPLE_RATE, dtype=np.float32),
+            language="en",
+            vad_filter=False
+        )
+        for _ in segments:
+            pass
+
+    async def transcribe_stream(
         self,
         audio_path: Path
-    ) -> tuple[list[TranscriptSegment], TranscriptionInfo]:
+    ) -> tuple[TranscriptionInfo, AsyncIterator[TranscriptSegment]]:
         """
-        Transcribe audio file and return segments with word-level timestamps.
-        Auto-detects language from audio.
+        Start transcribing and return the detected language info plus an
+        async iterator yielding segments as they are decoded, so callers
+        can act on them before the whole file is done.
         """
-        model = self._get_model()
+        settings = get_settings()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._get_model)
+        audio = await loop.run_in_executor(self._executor, self.load_audio, audio_path)
 
-        # Auto-detect language (language=None)
-        segments, info = model.transcribe(
-            str(audio_path),
-            word_timestamps=True,
-            vad_filter=True,
-            language=None  # Auto-detect
+        # Language detection and VAD run here; decoding happens lazily
+        # while the returned generator is consumed
+        segments, info = await loop.run_in_executor(
+            self._executor,
+            functools.partial(
+                self._pipeline.transcribe,
+                audio,
+                batch_size=settings.whisper_batch_size,
+                word_timestamps=True,
+                vad_filter=True,
+                language=None  # Auto-detect
+            )
         )
 
         # Get transcription info with detected language
@@ -50,44 +128,103 @@ class TranscriptionService:
             language_probability=info.language_probability,
             duration=info.duration
         )
+        return transcription_info, self._iter_segments(segments)
+
+    def load_audio(self, audio_path: Path) -> np.ndarray:
+        """
+        Load audio as the float32 16 kHz mono array Whisper consumes, so it
+        is decoded once and can be reused. 16-bit PCM WAV at that rate (the
+        extract_audio output) is read directly without going through a
+        decoder; anything else is decoded and resampled by faster-whisper.
+        """
+        try:
+            with wave.open(str(audio_path), "rb") as wav:
+                if (
+                    wav.getframerate() == SAMPLE_RATE
+                    and wav.getnchannels() == 1
+                    and wav.getsampwidth() == 2
+                ):
+                    pcm = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2")
+                    return pcm.astype(np.float32) / 32768.0
+        except (wave.Error, EOFError):
+            pass
+        return decode_audio(str(audio_path), sampling_rate=SAMPLE_RATE)
+
+    async def _iter_segments(self, segments: Iterator[Segment]) -> AsyncIterator[TranscriptSegment]:
+        """
+        Drain the blocking faster-whisper generator on the whisper thread,
+        handing converted segments over through a bounded queue.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=16)
+        stop = threading.Event()
+
+        def produce() -> None:
+            try:
+                for segment in segments:
+                    if stop.is_set():
+                        return
+                    item = self._to_transcript_segment(segment)
+                    asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+                item = _END_OF_SEGMENTS
+            except Exception as e:
+                item = e
+            if not stop.is_set():
+                asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
 
-        result = []
-        for segment in segments:
-            words = []
-            if segment.words:
-                for word in segment.words:
-                    words.append(WordTimestamp(
-                        word=word.word.strip(),
-                        start=word.start,
-                        end=word.end
-                    ))
-
-            result.append(TranscriptSegment(
-                text=segment.text.strip(),
-                start=segment.start,
-                end=segment.end,
-                words=words
-            ))
-
-        return result, transcription_info
+        producer = loop.run_in_executor(self._executor, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END_OF_SEGMENTS:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+            await producer
+        finally:
+            if not producer.done():
+                # Consumer bailed out early: unblock and stop the producer
+                stop.set()
+                while not queue.empty():
+                    queue.get_nowait()
+
+    def _to_transcript_segment(self, segment: Segment) -> TranscriptSegment:
+        # faster-whisper already yields typed floats/strings, so skip
+        # pydantic validation for the (thousands of) words and segments
+        return TranscriptSegment.model_construct(
+            text=segment.text.strip(),
+            start=segment.start,
+            end=segment.end,
+            words=[
+                WordTimestamp.model_construct(
+                    word=word.word.strip(),
+                    start=word.start,
+                    end=word.end
+                )
+                for word in segment.words or ()
+            ]
+        )
 
     def get_full_transcript(self, segments: list[TranscriptSegment]) -> str:
         """Combine all segments into a single transcript text."""
         return " ".join(seg.text for seg in segments)
 
-    def get_words_in_range(
+    def build_word_index(self, segments: list[TranscriptSegment]) -> WordIndex:
+        """
+        Flatten all words once, with a parallel array of start times,
+        for repeated range lookups via get_words_in_range_indexed.
+        """
+        return build_word_index(segments)
+
+    def get_words_in_range_indexed(
         self,
-        segments: list[TranscriptSegment],
+        index: WordIndex,
         start_time: float,
         end_time: float
     ) -> list[WordTimestamp]:
-        """Get all words within a specific time range."""
-        words = []
-        for segment in segments:
-            for word in segment.words:
-                if start_time <= word.start <= end_time:
-                    words.append(word)
-        return words
+        """Get all words within a time range using a prebuilt word index."""
+        return words_in_range(index, start_time, end_time)
 
 
 transcription_service = TranscriptionService()
@@ -1,15 +1,27 @@
 import uuid
-import json
+import hashlib
+import asyncio
+import time
 import aiofiles
+import aiofiles.os
+from pydantic_core import to_json
 from pathlib import Path
-from datetime import datetime
+from typing import Iterable
+from datetime import datetime, timezone
 from app.models.schemas import JobResponse, JobStatus
+from app.services import job_store
+from app.config import get_settings
 
 
 def generate_job_id() -> str:
     return str(uuid.uuid4())
 
 
+def utcnow() -> datetime:
+    """Current time as a timezone-aware UTC datetime."""
+    return datetime.now(timezone.utc)
+
+
 def format_timestamp(seconds: float) -> str:
     """Convert seconds to HH:MM:SS.mmm format for FFmpeg."""
     hours = int(seconds // 3600)
@@ -18,45 +30,278 @@ def format_timestamp(seconds: float) -> str:
     return f"{hours:02d}:{minutes:02d}:{secs:06.3f}"
 
 
-def format_ass_timestamp(seconds: float) -> str:
-    """Convert seconds to H:MM:SS.cc format for ASS subtitles."""
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    centisecs = int((seconds % 1) * 100)
-    return f"{hours}:{minutes:02d}:{secs:02d}.{centisecs:02d}"
+def format_ass_timestamps(seconds: Iterable[float]) -> list[str]:
+    """Convert seconds to H:MM:SS.cc format for ASS subtitles, in batch."""
+    result = []
+    append = result.append
+    for value in seconds:
+        # Integer centisecond math: one float op, and no float-modulo error
+        # (e.g. 1.15 % 1 * 100 == 14.99...)
+        hours, rem = divmod(round(value * 100), 360000)
+        minutes, rem = divmod(rem, 6000)
+        secs, centisecs = divmod(rem, 100)
+        append("%d:%02d:%02d.%02d" % (hours, minutes, secs, centisecs))
+    return result
 
 
-async def save_job_status(jobs_path: Path, job_id: str, job: JobResponse) -> None:
-    job_file = jobs_path / f"{job_id}.json"
-    async with aiofiles.open(job_file, "w") as f:
-        await f.write(job.model_dump_json(indent=2))
+# Process-local fallback cache used when Redis is not configured
+_MEMORY_CACHE: dict[str, tuple[float, str]] = {}
+_MEMORY_CACHE_MAX_ENTRIES = 1024
+
+
+# Shard directories already created by this process
+_CREATED_SHARDS: set[Path] = set()
+
+
+def shard_dir(base: Path, job_id: str, create: bool = False) -> Path:
+    """
+    Per-job subdirectory keyed by the first two hex chars of the job ID.
+    Keeps directory sizes bounded to roughly N/256 entries.
+    """
+    path = base / job_id[:2]
+    if create and path not in _CREATED_SHARDS:
+        path.mkdir(parents=True, exist_ok=True)
+        _CREATED_SHARDS.add(path)
+    return path
+
+
+def _job_file(jobs_path: Path, job_id: str, create: bool = False) -> Path:
+    job_file = shard_dir(jobs_path, job_id, create) / f"{job_id}.json"
+    if not create and not job_file.exists():
+        # Jobs written before sharding live directly in jobs_path
+        legacy_file = jobs_path / f"{job_id}.json"
+        if legacy_file.exists():
+            return legacy_file
+    return job_file
+
+
+# Jobs this process is writing progress for (file store only). Entries are
+# only created by progress updates, so they belong to jobs whose sole writer
+# is this process (the job worker running them); the API process, which
+# reads jobs written by workers, never caches. Dropped once a job finishes.
+_JOB_CACHE: dict[str, JobResponse] = {}
+_TERMINAL_STATUSES = (JobStatus.COMPLETED, JobStatus.FAILED)
+
+# Job files above this size are parsed in a worker thread
+LARGE_JOB_BYTES = 64 * 1024
+
+
+def _use_redis() -> bool:
+    return get_settings().job_store == "redis"
+
+
+async def _write_job(jobs_path: Path, job_id: str, job: JobResponse) -> None:
+    if _use_redis():
+        await job_store.save_job(job_id, job)
+        return
+    if job.status in _TERMINAL_STATUSES:
+        _JOB_CACHE.pop(job_id, None)
+    elif job_id in _JOB_CACHE:
+        _JOB_CACHE[job_id] = job
+    job_file = _job_file(jobs_path, job_id, create=True)
+    # Write a temp file and rename it over the job file, so concurrent
+    # readers only ever see a complete document
+    tmp_file = job_file.with_suffix(".json.tmp")
+    # Compact bytes straight from pydantic-core: no indent, no str round-trip
+    async with aiofiles.open(tmp_file, "wb") as f:
+        await f.write(to_json(job))
+    await aiofiles.os.replace(tmp_file, job_file)
 
 
 async def load_job_status(jobs_path: Path, job_id: str) -> JobResponse | None:
-    job_file = jobs_path / f"{job_id}.json"
+    if _use_redis():
+        return await job_store.load_job(job_id)
+    cached = _JOB_CACHE.get(job_id)
+    if cached is not None:
+        return cached
+    job_file = _job_file(jobs_path, job_id)
     if not job_file.exists():
         return None
-    async with aiofiles.open(job_file, "r") as f:
+    async with aiofiles.open(job_file, "rb") as f:
         content = await f.read()
-        data = json.loads(content)
-        return JobResponse(**data)
+    # Parse and validate straight from JSON bytes; completed jobs carry the
+    # whole transcript, so big files are handled off the event loop
+    if len(content) > LARGE_JOB_BYTES:
+        return await asyncio.to_thread(JobResponse.model_validate_json, content)
+    return JobResponse.model_validate_json(content)
 
 
-async def update_job_progress(
+async def load_job_status_raw(jobs_path: Path, job_id: str) -> bytes | None:
+    """Load the serialized job JSON without validating it into a JobResponse."""
+    if _use_redis():
+        return await job_store.load_job_raw(job_id)
+    job_file = _job_file(jobs_path, job_id)
+    if not job_file.exists():
+        return None
+    async with aiofiles.open(job_file, "rb") as f:
+        return await f.read()
+
+
+async def _write_progress(
     jobs_path: Path,
     job_id: str,
     status: JobStatus,
     progress: int,
-    message: str = ""
+    message: str,
+    updated_at: datetime
 ) -> None:
-    job = await load_job_status(jobs_path, job_id)
+    if _use_redis():
+        # Partial hash update, the full job blob is left untouched
+        await job_store.update_job_progress(job_id, status, progress, message, updated_at)
+        return
+    job = _JOB_CACHE.get(job_id)
+    if job is not None and not _job_file(jobs_path, job_id).exists():
+        # Deleted through the API while running: don't recreate the file
+        _JOB_CACHE.pop(job_id, None)
+        return
+    job = job or await load_job_status(jobs_path, job_id)
     if job:
         job.status = status
         job.progress = progress
         job.message = message
-        job.updated_at = datetime.utcnow()
-        await save_job_status(jobs_path, job_id, job)
+        job.updated_at = updated_at
+        _JOB_CACHE[job_id] = job
+        await _write_job(jobs_path, job_id, job)
+
+
+class JobWriter:
+    """
+    Coalesces job status writes.
+
+    Progress updates that keep the same status are buffered and flushed at
+    most every `interval` seconds; status transitions and full job saves are
+    written through immediately and supersede anything buffered.
+    """
+
+    def __init__(self, interval: float = 0.25):
+        self.interval = interval
+        self._pending: dict[str, tuple[Path, JobStatus, int, str]] = {}
+        self._last_status: dict[str, JobStatus] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._lock: asyncio.Lock | None = None
+        self._flusher: asyncio.Task | None = None
+
+    def _bind(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Worker processes run each job under its own asyncio.run()
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._flusher = None
+        return self._lock
+
+    async def update(
+        self,
+        jobs_path: Path,
+        job_id: str,
+        status: JobStatus,
+        progress: int,
+        message: str
+    ) -> None:
+        lock = self._bind()
+        if self._last_status.get(job_id) != status:
+            self._pending.pop(job_id, None)
+            async with lock:
+                await _write_progress(jobs_path, job_id, status, progress, message, utcnow())
+            self._last_status[job_id] = status
+            return
+
+        self._pending[job_id] = (jobs_path, status, progress, message)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def save(self, jobs_path: Path, job_id: str, job: JobResponse) -> None:
+        lock = self._bind()
+        self._pending.pop(job_id, None)
+        async with lock:
+            await _write_job(jobs_path, job_id, job)
+        # Status is only tracked for jobs this process sends progress for;
+        # the API process saves every new job but never updates progress
+        if job.status in _TERMINAL_STATUSES:
+            self._last_status.pop(job_id, None)
+        elif job_id in self._last_status:
+            self._last_status[job_id] = job.status
+
+    async def flush(self) -> None:
+        async with self._bind():
+            # Stamped at write time, once for the whole batch
+            now = utcnow()
+            for job_id in list(self._pending):
+                entry = self._pending.pop(job_id, None)
+                if entry:
+                    jobs_path, status, progress, message = entry
+                    await _write_progress(jobs_path, job_id, status, progress, message, now)
+
+    async def _flush_loop(self) -> None:
+        while self._pending:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+
+job_writer = JobWriter()
+
+
+async def save_job_status(jobs_path: Path, job_id: str, job: JobResponse) -> None:
+    await job_writer.save(jobs_path, job_id, job)
+
+
+async def update_job_progress(
+    jobs_path: Path,
+    job_id: str,
+    status: JobStatus,
+    progress: int,
+    message: str = ""
+) -> None:
+    await job_writer.update(jobs_path, job_id, status, progress, message)
+
+
+async def job_exists(jobs_path: Path, job_id: str) -> bool:
+    """Whether the job record still exists (it may be deleted mid-run)."""
+    if _use_redis():
+        return await job_store.job_exists(job_id)
+    return _job_file(jobs_path, job_id).exists()
+
+
+async def delete_job_status(jobs_path: Path, job_id: str) -> None:
+    if _use_redis():
+        await job_store.delete_job(job_id)
+        return
+    _JOB_CACHE.pop(job_id, None)
+    _job_file(jobs_path, job_id).unlink(missing_ok=True)
+
+
+def video_info_cache_key(url: str) -> str:
+    return "vinfo:" + hashlib.sha1(url.encode()).hexdigest()
+
+
+async def cache_get(key: str) -> str | None:
+    """Get a cached string value, or None if missing or expired."""
+    if _use_redis():
+        value = await job_store.cache_get(key)
+        return value.decode() if value is not None else None
+    entry = _MEMORY_CACHE.get(key)
+    if entry is None:
+        return None
+    expires_at, value = entry
+    if expires_at < time.monotonic():
+        del _MEMORY_CACHE[key]
+        return None
+    return value
+
+
+async def cache_set(key: str, value: str, ttl: int) -> None:
+    """Cache a string value for ttl seconds."""
+    if _use_redis():
+        await job_store.cache_set(key, value, ttl)
+        return
+    if len(_MEMORY_CACHE) >= _MEMORY_CACHE_MAX_ENTRIES:
+        # Drop the oldest entry (dicts keep insertion order)
+        _MEMORY_CACHE.pop(next(iter(_MEMORY_CACHE)))
+    _MEMORY_CACHE[key] = (time.monotonic() + ttl, value)
+
+
+# Characters unsafe in filenames, all mapped to "_" in a single pass
+_UNSAFE_FILENAME_CHARS = str.maketrans({char: "_" for char in '<>:"/\\|?*'})
 
 
 def get_file_extension(filename: str) -> str:
@@ -65,7 +310,4 @@ def get_file_extension(filename: str) -> str:
 
 def sanitize_filename(filename: str) -> str:
     """Remove or replace characters that are unsafe for filenames."""
-    unsafe_chars = '<>:"/\\|?*'
-    for char in unsafe_chars:
-        filename = filename.replace(char, "_")
-    return filename
+    return filename.translate(_UNSAFE_FILENAME_CHARS)
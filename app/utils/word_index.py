@@ -0,0 +1,29 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from app.models.schemas import TranscriptSegment, WordTimestamp
+
+
+# Flattened transcript words plus a parallel array of their start times
+WordIndex = tuple[list[WordTimestamp], array]
+
+
+def build_word_index(segments: list[TranscriptSegment]) -> WordIndex:
+    """Flatten all words once for repeated time range lookups."""
+    flat = [word for segment in segments for word in segment.words]
+    starts = array("d", [word.start for word in flat])
+    return flat, starts
+
+
+def find_range(starts: array, lo: float, hi: float) -> tuple[int, int]:
+    """
+    Index range [i0, i1) of the words starting within [lo, hi].
+    Binary search over the packed float64 starts: O(log N).
+    """
+    return bisect_left(starts, lo), bisect_right(starts, hi)
+
+
+def words_in_range(index: WordIndex, lo: float, hi: float) -> list[WordTimestamp]:
+    """Words starting within [lo, hi]."""
+    flat, starts = index
+    i0, i1 = find_range(starts, lo, hi)
+    return flat[i0:i1]
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from app.models.schemas import JobStatus, ProcessRequest, VideoInfoResponse
+from app.services.processor import video_processor
+from app.services.download_service import download_service
+from app.services.transcription import transcription_service
+from app.services.gemini_service import gemini_service
+from app.services.minimax_service import minimax_service
+from app.services import job_store
+from app.utils.helpers import (
+    load_job_status, save_job_status, update_job_progress, utcnow, shard_dir,
+    cache_set, video_info_cache_key
+)
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+def _init_worker() -> None:
+    """Warm up each worker process before it takes its first job."""
+    if not settings.whisper_preload:
+        return
+    try:
+        transcription_service.warmup()
+    except Exception:
+        # Not fatal: the model is loaded again on the first transcription
+        logger.exception("Whisper warmup failed")
+
+
+def _noop() -> None:
+    pass
+
+
+def _new_executor() -> ProcessPoolExecutor:
+    # Jobs run in separate processes so Whisper/ffmpeg orchestration never
+    # holds the API worker's GIL. Children are spawned rather than forked so
+    # they start without the parent's threads, event loop, or CUDA state.
+    return ProcessPoolExecutor(
+        max_workers=settings.worker_processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker
+    )
+
+
+EXECUTOR = _new_executor()
+
+
+def _replace_broken_executor(broken: ProcessPoolExecutor) -> None:
+    """
+    Swap in a fresh pool after a worker process died (e.g. OOM-killed):
+    a broken ProcessPoolExecutor rejects every later submit.
+    """
+    global EXECUTOR
+    if EXECUTOR is broken:
+        logger.error("Job worker process died, restarting the process pool")
+        broken.shutdown(wait=False, cancel_futures=True)
+        EXECUTOR = _new_executor()
+
+
+# Backpressure: at most max_concurrent_jobs run at once, at most
+# max_queue_depth wait behind them; anything beyond that is rejected.
+JOB_SEM = asyncio.Semaphore(settings.max_concurrent_jobs)
+JOB_QUEUE: asyncio.Queue = asyncio.Queue(maxsize=settings.max_queue_depth)
+
+_dispatcher_task: asyncio.Task | None = None
+# Failure-marking tasks started from pool callbacks, kept alive until done
+_failure_marks: set[asyncio.Task] = set()
+
+SHUTDOWN_ERROR = "Server shut down before the job started"
+
+
+async def _mark_job_failed(job_id: str, error: Exception) -> None:
+    job = await load_job_status(settings.jobs_path, job_id)
+    if job:
+        job.status = JobStatus.FAILED
+        job.error = str(error)
+        job.message = f"Processing failed: {str(error)}"
+        job.updated_at = utcnow()
+        await save_job_status(settings.jobs_path, job_id, job)
+
+
+async def _process_file_job(job_id: str, video_path: Path, request: ProcessRequest) -> None:
+    try:
+        await video_processor.process_video(job_id, video_path, request)
+    except Exception as e:
+        await _mark_job_failed(job_id, e)
+
+
+async def _process_url_job(job_id: str, url: str, request: ProcessRequest) -> None:
+    try:
+        # Update status to downloading
+        await update_job_progress(
+            settings.jobs_path, job_id, JobStatus.DOWNLOADING, 5,
+            "Downloading video..."
+        )
+
+        # Download video
+        video_path, source_type, video_info = await download_service.download(
+            url,
+            shard_dir(settings.upload_path, job_id, create=True),
+            job_id
+        )
+
+        source = source_type
+        if video_info:
+            if settings.job_store == "redis":
+                # Reuse the download's probe for later /video-info lookups.
+                # Without Redis the cache is process-local and this worker's
+                # copy is never read by the API process
+                await cache_set(
+                    video_info_cache_key(url),
+                    VideoInfoResponse(**video_info).model_dump_json(),
+                    settings.video_info_cache_ttl
+                )
+            source = f"{source_type}: {video_info['title']}"
+
+        await update_job_progress(
+            settings.jobs_path, job_id, JobStatus.PROCESSING, 10,
+            f"Download complete ({source}). Starting processing..."
+        )
+
+        # Process the downloaded video
+        await video_processor.process_video(job_id, video_path, request)
+
+    except Exception as e:
+        await _mark_job_failed(job_id, e)
+
+
+async def _run_job(job) -> None:
+    """
+    Run a job coroutine, then close the clients created for its event loop;
+    each job gets a fresh loop from asyncio.run().
+    """
+    try:
+        await job
+    finally:
+        await gemini_service.aclose()
+        await minimax_service.aclose()
+        await job_store.close_redis()
+
+
+def _run_file_job(job_id: str, path_str: str, request_json: str) -> None:
+    """Process an uploaded video file inside a worker process."""
+    request = ProcessRequest.model_validate_json(request_json)
+    asyncio.run(_run_job(_process_file_job(job_id, Path(path_str), request)))
+
+
+def _run_url_job(job_id: str, url: str, request_json: str) -> None:
+    """Download and process a video from URL inside a worker process."""
+    request = ProcessRequest.model_validate_json(request_json)
+    asyncio.run(_run_job(_process_url_job(job_id, url, request)))
+
+
+def enqueue_job(fn, *args) -> None:
+    """
+    Queue a job for the dispatcher.
+    Raises asyncio.QueueFull when the backlog is already at max_queue_depth.
+    """
+    JOB_QUEUE.put_nowait((fn, args))
+
+
+async def _dispatcher() -> None:
+    """Pull jobs off the queue and run them in the pool, bounded by JOB_SEM."""
+    loop = asyncio.get_running_loop()
+
+    def _on_done(future: asyncio.Future, job_id: str, executor: ProcessPoolExecutor) -> None:
+        JOB_SEM.release()
+        JOB_QUEUE.task_done()
+        if future.cancelled():
+            # Still waiting in the pool when shutdown cancelled it
+            error = RuntimeError(SHUTDOWN_ERROR)
+        else:
+            error = future.exception()
+            if error is None:
+                return
+            # Job functions handle their own errors; anything reaching here
+            # means the worker process itself failed
+            logger.error("Job %s crashed in the worker pool", job_id, exc_info=error)
+            if isinstance(error, BrokenProcessPool):
+                _replace_broken_executor(executor)
+        task = loop.create_task(_mark_job_failed(job_id, error))
+        _failure_marks.add(task)
+        task.add_done_callback(_failure_marks.discard)
+
+    while True:
+        fn, args = await JOB_QUEUE.get()
+        try:
+            await JOB_SEM.acquire()
+        except asyncio.CancelledError:
+            # Already off the queue, so shutdown_executor can't see it
+            await _mark_job_failed(args[0], RuntimeError(SHUTDOWN_ERROR))
+            raise
+        executor = EXECUTOR
+        try:
+            future = loop.run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            _replace_broken_executor(executor)
+            executor = EXECUTOR
+            future = loop.run_in_executor(executor, fn, *args)
+        future.add_done_callback(
+            lambda f, job_id=args[0], executor=executor: _on_done(f, job_id, executor)
+        )
+
+
+def start_dispatcher() -> None:
+    global _dispatcher_task
+    _dispatcher_task = asyncio.create_task(_dispatcher())
+    if settings.whisper_preload:
+        # Worker processes start on demand; start (and warm) them all now
+        for _ in range(settings.worker_processes):
+            EXECUTOR.submit(_noop)
+
+
+async def shutdown_executor() -> None:
+    """Stop accepting jobs and wait for running ones to finish."""
+    if _dispatcher_task:
+        _dispatcher_task.cancel()
+        # Let it fail the job it may be holding
+        await asyncio.wait([_dispatcher_task])
+    # Jobs that never reached the pool would otherwise stay PENDING forever
+    while not JOB_QUEUE.empty():
+        _fn, args = JOB_QUEUE.get_nowait()
+        await _mark_job_failed(args[0], RuntimeError(SHUTDOWN_ERROR))
+    await asyncio.to_thread(EXECUTOR.shutdown, wait=True, cancel_futures=True)
+    # Jobs cancelled inside the pool are failed from its callbacks
+    if _failure_marks:
+        await asyncio.wait(list(_failure_marks))